@@ -1,9 +1,28 @@
 """ A command-line parser you won't hate
 """
+import io
+import os
+import sys
+import mmap
+import time
 import shlex
+import struct
+import enum
+import select
+import pickle
+import hashlib
 import collections
-from itertools import tee
-from functools import update_wrapper
+import collections.abc
+from copy import copy
+from bisect import bisect_left
+from itertools import chain, tee
+from operator import methodcaller
+from functools import lru_cache, update_wrapper
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Executor as BaseExecutor
+from inspect import CO_VARARGS
+from stat import S_ISREG
 
 
 class Action(object):
@@ -12,10 +31,27 @@ class Action(object):
     shlex = shlex
     namedtuple = collections.namedtuple
     OrderedDict = collections.OrderedDict
+    ChainMap = collections.ChainMap
+
+    # stands for an option value that could not be parsed
+    # while errors are being collected
+    _invalid = object()
+
+    Replay = collections.namedtuple(
+        'Replay', 'count failures elapsed recorded')
+    Outcome = collections.namedtuple(
+        'Outcome', 'value error stdout stderr')
+    Usage = collections.namedtuple(
+        'Usage', 'count failures parse run histogram')
+    Invocation = collections.namedtuple(
+        'Invocation', 'number action args leftover')
+    Failure = collections.namedtuple(
+        'Failure', 'number line errors')
 
     class Option(object):
         """ Abstract base for flags and options
         """
+        __slots__ = ('type', 'long', 'short')
 
         def __init__(
             self,
@@ -36,8 +72,8 @@ class Action(object):
                     'short form should be at most of one character')
 
             self.type = type
-            self.long = long
-            self.short = short
+            self.long = long and sys.intern(long)
+            self.short = short and sys.intern(short)
 
         def __call__(self, old=None, new=None):
             """ Called on each occurrence of this option
@@ -71,6 +107,7 @@ class Action(object):
     class Flag(Option):
         """ Like `-q`, `--quiet`
         """
+        __slots__ = ()
 
         def __call__(self, old, new):
             return True
@@ -78,12 +115,14 @@ class Action(object):
     class Count(Option):
         """ Like `-v`, `--verbose`
         """
+        __slots__ = ()
 
         def __call__(self, old, new):
             return (old if old else 0) + 1
 
     class Key(Option):
         """ Like `-c32`, `--count=32` """
+        __slots__ = ()
 
         def __init__(
             self,
@@ -97,8 +136,614 @@ class Action(object):
                 raise RuntimeError(
                     'key {} should be specified at most once'.format(
                         self.long or self.short))
+            return self.convert(new)
+
+        def convert(self, new):
+            """ Make a value out of a string taken from the command line
+            """
             return self.type.__call__(new)
 
+    class Accumulator(Option):
+        """ Abstract base for options collecting every occurrence
+
+            Instead of producing a new value on each occurrence,
+            an accumulator makes a mutable collection once,
+            updates it in place and freezes it in the end
+        """
+        __slots__ = ()
+
+        def __init__(
+            self,
+            short=None, long=None,
+            *, type=str
+        ):
+            super().__init__(short, long, type=type)
+
+        def initial(self):
+            """ Shall return an empty mutable collection
+            """
+            raise NotImplementedError(
+                'Accumulator.initial should be overridden'
+                ' by a descendant')
+
+        def step(self, collected, new):
+            """ Shall put a string `new` taken from the command line
+                into `collected` in place
+            """
+            raise NotImplementedError(
+                'Accumulator.step should be overridden'
+                ' by a descendant')
+
+        def finish(self, collected):
+            """ Shall return a value that could be passed
+                to the action function
+            """
+            return collected
+
+        def __call__(self, old, new):
+            if old is None:
+                old = self.initial()
+            self.step(old, new)
+            return old
+
+    class Append(Accumulator):
+        """ Like `-I include -I lib`
+        """
+        __slots__ = ()
+
+        def initial(self):
+            return []
+
+        def step(self, collected, new):
+            collected.append(self.type.__call__(new))
+
+        def finish(self, collected):
+            return tuple(collected)
+
+    class Extend(Accumulator):
+        """ Like `--with=ssl,zlib --with=bz2`
+        """
+        __slots__ = ()
+
+        def __init__(
+            self,
+            short=None, long=None,
+            *, type=methodcaller('split', ',')
+        ):
+            super().__init__(short, long, type=type)
+
+        def initial(self):
+            return []
+
+        def step(self, collected, new):
+            collected.extend(self.type.__call__(new))
+
+        def finish(self, collected):
+            return tuple(collected)
+
+    class Set(Accumulator):
+        """ Like `-t fast -t slow -t fast`
+        """
+        __slots__ = ()
+
+        def initial(self):
+            return set()
+
+        def step(self, collected, new):
+            collected.add(self.type.__call__(new))
+
+        def finish(self, collected):
+            return frozenset(collected)
+
+    class Executor(Key):
+        """ Annotation like `pool: action.Executor`
+            passing a pool of `-j`, `--jobs` workers,
+            as many as there are processors by default;
+            the pool is started on first use
+            and shut down once the action returns
+        """
+        __slots__ = ('pool',)
+
+        def __init__(
+            self,
+            short='j', long='jobs',
+            *, pool=ThreadPoolExecutor
+        ):
+            super().__init__(short, long, type=int)
+            self.pool = pool
+
+        def convert(self, new):
+            jobs = self.type.__call__(new)
+            if isinstance(jobs, Action.Thunk):
+                # the number is converted later, like by `concurrent`,
+                # and so is the pool made
+                return Action.Thunk(self.start, jobs)
+            return self.start(jobs)
+
+        def start(self, jobs):
+            """ Return a pool of `jobs` workers, yet to be started
+            """
+            if isinstance(jobs, Action.Thunk):
+                jobs = jobs.__call__()
+            if jobs < 1:
+                raise ValueError('number of jobs should be positive')
+            return Action._Pool(self.pool, jobs)
+
+        def default(self):
+            return self.start(os.cpu_count() or 1)
+
+        def __repr__(self):
+            return 'Executor({!r}, {!r}, pool={})'.format(
+                self.short, self.long, self.pool.__name__)
+
+    class _Pool(BaseExecutor):
+        """ Executor of a given type and size
+            made only once something is submitted to it
+        """
+
+        def __init__(self, type, jobs):
+            self.type = type
+            self.jobs = jobs
+            self._executor = None
+
+        def submit(self, *args, **kwargs):
+            if self._executor is None:
+                self._executor = self.type(max_workers=self.jobs)
+            return self._executor.submit(*args, **kwargs)
+
+        def map(self, function, *iterables, **keywords):
+            if self._executor is None:
+                self._executor = self.type(max_workers=self.jobs)
+            return self._executor.map(function, *iterables, **keywords)
+
+        def shutdown(self, wait=True, **keywords):
+            if self._executor is not None:
+                self._executor.shutdown(wait, **keywords)
+
+        def __exit__(self, *exc_info):
+            # the pool is shared by the whole action,
+            # so leaving a `with` block inside it keeps the pool running
+            return False
+
+        close = shutdown
+
+        def __repr__(self):
+            return '_Pool({}, {})'.format(self.type.__name__, self.jobs)
+
+    class MappedFile(mmap.mmap):
+        """ Annotation mapping a file into memory read-only;
+            the mapping is closed once the action returns
+        """
+
+        def __new__(cls, path):
+            if path == '-':
+                if not S_ISREG(os.fstat(0).st_mode):
+                    raise ValueError(
+                        'standard input could not be mapped'
+                        ' unless redirected from a file')
+                return super().__new__(cls, 0, 0, access=mmap.ACCESS_READ)
+            with open(path, 'rb') as file:
+                return super().__new__(
+                    cls, file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    class InputStream(io.BufferedReader):
+        """ Annotation opening a file for buffered binary reading,
+            or taking standard input for `-`;
+            the stream is closed once the action returns
+        """
+
+        def __init__(self, path):
+            if path == '-':
+                raw = io.FileIO(0, 'rb', closefd=False)
+            else:
+                raw = io.FileIO(path, 'rb')
+            super().__init__(raw, buffer_size=1 << 20)
+
+    class Choice(object):
+        """ Annotation accepting one of the given names,
+            or a unique prefix of one if `prefix` is set;
+            an `enum.Enum` subclass stands for its members' names
+        """
+        __slots__ = (
+            'values', 'prefix', '_lookup', '_sorted', '_vocabulary')
+
+        def __init__(self, values, *, prefix=False):
+            self.values = values
+            self.prefix = prefix
+            self._lookup = None
+            self._sorted = None
+            self._vocabulary = None
+
+        def prepare(self):
+            """ Build lookup structures unless they are built already
+            """
+            if self._lookup is not None:
+                return
+            values = self.values
+            if isinstance(values, type) and issubclass(values, enum.Enum):
+                lookup = dict(values.__members__)
+            else:
+                lookup = {str(value): value for value in values}
+            self._sorted = sorted(lookup)
+            self._lookup = lookup
+
+        def __call__(self, new):
+            self.prepare()
+            try:
+                return self._lookup[new]
+            except KeyError:
+                pass
+
+            if self.prefix and new:
+                matches = self.complete(new)
+                if len(matches) == 1:
+                    return self._lookup[matches[0]]
+                if matches:
+                    raise ValueError(
+                        'ambiguous choice: `{}` could be {}'.format(
+                            new, ' or '.join(
+                                '`{}`'.format(match)
+                                for match in matches[:3])))
+
+            if self._vocabulary is None:
+                self._vocabulary = Action._Vocabulary(self._sorted)
+            raise ValueError('invalid choice: `{}`{}'.format(
+                new, Action._suggest(new, self._vocabulary)))
+
+        def complete(self, prefix):
+            """ Return choices starting with `prefix` in sorted order
+            """
+            self.prepare()
+            return Action._prefixed(self._sorted, prefix)
+
+        def __repr__(self):
+            return 'Choice({!r}{})'.format(
+                self.values, ', prefix=True' if self.prefix else '')
+
+    class Thunk(object):
+        """ Call postponed until its result is asked for
+            by calling the thunk itself; the result is remembered
+        """
+        __slots__ = ('_function', '_argument', '_value')
+
+        def __init__(self, function, argument):
+            self._function = function
+            self._argument = argument
+            self._value = self
+
+        def __call__(self):
+            if self._value is self:
+                self._value = self._function.__call__(self._argument)
+                self._function = self._argument = None
+            return self._value
+
+        @property
+        def evaluated(self):
+            return self._value is not self
+
+        def __repr__(self):
+            if self.evaluated:
+                return 'Thunk(value={!r})'.format(self._value)
+            return 'Thunk({!r}, {!r})'.format(
+                self._function, self._argument)
+
+    class Lazy(object):
+        """ Annotation postponing a conversion:
+            `config: action.Lazy(load_json)` passes a `Thunk`
+            which loads the file once called
+        """
+        __slots__ = ('converter',)
+
+        def __init__(self, converter):
+            if not callable(converter):
+                raise TypeError('converter should be callable')
+            self.converter = converter
+
+        def __call__(self, new):
+            return Action.Thunk(self.converter, new)
+
+        def __repr__(self):
+            return 'Lazy({!r})'.format(self.converter)
+
+    class Factory(object):
+        """ Default value computed by calling `make()`
+            only when the argument was not given
+        """
+        __slots__ = ('make',)
+
+        def __init__(self, make):
+            if not callable(make):
+                raise TypeError('factory should be callable')
+            self.make = make
+
+        def __repr__(self):
+            return 'Factory({!r})'.format(self.make)
+
+    class _Cache(object):
+        """ Results of an action pickled into files of a directory,
+            evicted by the least recent access time
+        """
+
+        def __init__(self, directory, size, inputs, version):
+            self.directory = directory
+            self.size = size
+            self.inputs = inputs
+            self.version = version
+
+        @classmethod
+        def fingerprint(cls, code):
+            """ Return a digest of what a function does,
+                which changes along with its body
+            """
+            digest = hashlib.sha256(code.co_code)
+            digest.update(repr(code.co_names).encode('utf-8'))
+            for constant in code.co_consts:
+                if isinstance(constant, type(code)):
+                    # a nested function or a comprehension
+                    digest.update(cls.fingerprint(constant))
+                elif isinstance(constant, frozenset):
+                    # ordered by string hashes, which differ across runs
+                    digest.update(
+                        repr(sorted(map(repr, constant))).encode('utf-8'))
+                else:
+                    digest.update(repr(constant).encode('utf-8'))
+            return digest.digest()
+
+        def key(self, action, args, leftover):
+            """ Return a digest of the action code, arguments
+                and input files, or None if arguments could not be pickled
+            """
+            fingerprints = []
+            for name in self.inputs:
+                try:
+                    status = os.stat(args[name])
+                    fingerprints.append(
+                        (status.st_size, status.st_mtime_ns))
+                except (KeyError, TypeError, OSError):
+                    fingerprints.append(None)
+            try:
+                payload = pickle.dumps((
+                    action.__module__, action.__qualname__, self.version,
+                    sorted(args.items()), leftover, fingerprints),
+                    protocol=4)
+            except Exception:
+                return None
+            return hashlib.sha256(payload).hexdigest()
+
+        def load(self, key):
+            """ Return a pair of whether a result was found
+                and the result itself
+            """
+            path = os.path.join(self.directory, key)
+            try:
+                with open(path, 'rb') as file:
+                    result = pickle.load(file)
+                self.touch(path)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                return False, None
+            return True, result
+
+        def store(self, key, result):
+            try:
+                payload = pickle.dumps(result, protocol=4)
+            except Exception:
+                # like generators, which should rather be recomputed
+                return
+            if len(payload) > self.size:
+                return
+
+            path = os.path.join(self.directory, key)
+            temporary = '{}.{}.tmp'.format(path, os.getpid())
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(temporary, 'wb') as file:
+                    file.write(payload)
+                os.replace(temporary, path)
+                self.touch(path)
+                self.evict()
+            except OSError:
+                # the result is returned all the same,
+                # only it would be computed again next time
+                try:
+                    os.remove(temporary)
+                except OSError:
+                    pass
+
+        @staticmethod
+        def touch(path):
+            """ Mark an entry as used just now
+            """
+            # file systems tend to round times given by the kernel,
+            # while explicit times are stored as they are
+            now = time.time_ns()
+            os.utime(path, ns=(now, now))
+
+        def evict(self):
+            """ Remove least recently used results
+                until the rest fits into the size limit
+            """
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as listing:
+                for entry in listing:
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        status = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append(
+                        (status.st_mtime_ns, status.st_size, entry.path))
+                    total += status.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    class _Watcher(object):
+        """ Tells when some of the given files or directories change,
+            waking up through inotify where it is available
+            or looking at them every `interval` seconds otherwise
+        """
+
+        # IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM,
+        # IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_DELETE_SELF
+        events = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400
+
+        def __init__(self, paths, interval):
+            self.paths = [os.path.abspath(path) for path in paths]
+            self.interval = interval
+            self.state = self.snapshot()
+            self.fd = self.inotify()
+
+        def wait(self, timeout=None):
+            """ Block until something changes or `timeout` passes;
+                return whether something has changed
+            """
+            deadline = None
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
+            while True:
+                pause = self.interval
+                if deadline is not None:
+                    pause = max(0, min(pause, deadline - time.monotonic()))
+                if self.fd is None:
+                    time.sleep(pause)
+                elif select.select([self.fd], [], [], pause)[0]:
+                    try:
+                        while os.read(self.fd, 1 << 16):
+                            pass
+                    except BlockingIOError:
+                        pass
+
+                state = self.snapshot()
+                if state != self.state:
+                    self.state = state
+                    return True
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+
+        def snapshot(self):
+            """ Return sizes and modification times
+                of watched files and of files inside watched directories
+            """
+            state = {}
+            for path in self.paths:
+                for each in self.walk(path):
+                    try:
+                        status = os.stat(each)
+                    except OSError:
+                        continue
+                    state[each] = (
+                        status.st_ino, status.st_size, status.st_mtime_ns)
+            return state
+
+        @staticmethod
+        def walk(path):
+            yield path
+            if os.path.isdir(path):
+                for directory, _, files in os.walk(path):
+                    yield directory
+                    for name in files:
+                        yield os.path.join(directory, name)
+
+        def inotify(self):
+            """ Return a descriptor watching over parent directories
+                of watched files and over watched directories,
+                or None if inotify is not available
+            """
+            try:
+                import ctypes
+                libc = ctypes.CDLL(None, use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            except (ImportError, OSError, AttributeError):
+                return None
+            if fd < 0:
+                return None
+
+            directories = set()
+            for path in self.paths:
+                if os.path.isdir(path):
+                    directories.update(
+                        directory for directory, _, _ in os.walk(path))
+                directories.add(os.path.dirname(path))
+            for directory in directories:
+                # a failure leaves that directory to the periodic check
+                libc.inotify_add_watch(
+                    fd, os.fsencode(directory), self.events)
+            return fd
+
+        def close(self):
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    class _Vocabulary(object):
+        """ Burkhard-Keller tree over a set of words
+            answering which of them are within
+            a given edit distance from a query
+        """
+
+        def __init__(self, words=()):
+            # each node is a pair of a word
+            # and a dict of children keyed by distance to that word
+            self.root = None
+            for word in words:
+                self.add(word)
+
+        def add(self, word):
+            if self.root is None:
+                self.root = (word, {})
+                return
+            node = self.root
+            while True:
+                node_word, children = node
+                distance = self.distance(word, node_word)
+                if distance == 0:
+                    return
+                if distance not in children:
+                    children[distance] = (word, {})
+                    return
+                node = children[distance]
+
+        def search(self, word, radius):
+            """ Return words at most `radius` edits away from `word`,
+                closest first
+            """
+            found = []
+            pending = [self.root] if self.root is not None else []
+            while pending:
+                node_word, children = pending.pop()
+                distance = self.distance(word, node_word)
+                if distance <= radius:
+                    found.append((distance, node_word))
+                for each in range(distance - radius, distance + radius + 1):
+                    if each in children:
+                        pending.append(children[each])
+            return [each for _, each in sorted(found)]
+
+        @staticmethod
+        def distance(a, b):
+            """ Levenshtein distance between two strings
+            """
+            if len(a) < len(b):
+                a, b = b, a
+            previous = list(range(len(b) + 1))
+            for i, x in enumerate(a, 1):
+                current = [i]
+                for j, y in enumerate(b, 1):
+                    current.append(min(
+                        previous[j] + 1,
+                        current[j - 1] + 1,
+                        previous[j - 1] + (x != y)))
+                previous = current
+            return previous[-1]
+
     def __init__(self):
         # actions are created with `@action` decorator;
         # during execution, we shall select one action
@@ -106,6 +751,33 @@ class Action(object):
         self.actions = {}
         self.default_action = None
 
+        # a context made by `fork` looks up actions
+        # in the parent's registry unless it has its own
+        self.parent = None
+
+        # lookup structures for suggestions are only built
+        # once some name could not be found
+        self._vocabulary = None
+        self._names = None
+
+        # a word separating invocations chained in one command line,
+        # like `fetch a + fetch b + index` with `+`
+        self.delimiter = None
+
+        # path of a file to append usage statistics to
+        self.statistics = None
+
+        # path of a file to append every executed command line to
+        self.recording = None
+
+        # whether to take `--profile`, `--trace-malloc`
+        # and `--measure` for this context's own options
+        self.diagnostics = False
+
+        # option mappers derived from annotations,
+        # keyed by their constructor arguments
+        self._mappers = {}
+
     def __call__(self, function):
         """ Make a function into an action
             and record it as such
@@ -120,17 +792,222 @@ class Action(object):
         """
         return type(self)()
 
+    def fork(self):
+        """ Create action parser which sees all actions of this one
+            and could add or override actions of its own
+            without copying or affecting this one's
+        """
+        child = type(self)()
+        child.parent = self
+        child.actions = self.ChainMap({}, self.actions)
+        child.default_action = self.default_action
+        child.delimiter = self.delimiter
+        child.diagnostics = self.diagnostics
+        child.statistics = self.statistics
+        child.recording = self.recording
+        child._mappers = self.ChainMap({}, self._mappers)
+        return child
+
+    def simulate(self, argv, *, env=None):
+        """ Execute a command line against a fork of this parser
+            the way a test would run the program
+
+            argv -- list of arguments, or a string to split
+            env -- variables to set in `os.environ` for the run
+
+            Return `Outcome` of the returned value or raised exception
+            and what was printed to stdout and stderr;
+            `sys.argv` and `os.environ` are restored afterwards,
+            and neither usage statistics nor recordings are written
+        """
+        if isinstance(argv, str):
+            argv = self.shlex.split(argv)
+        argv = list(argv)
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        saved_argv = sys.argv
+        saved_environ = dict(os.environ)
+        saved_streams = sys.stdout, sys.stderr
+        value = error = None
+        try:
+            sys.argv = sys.argv[:1] + argv
+            os.environ.update(env or {})
+            sys.stdout, sys.stderr = stdout, stderr
+            # simulated runs are not the program being used
+            context = self.fork()
+            context.statistics = None
+            context.recording = None
+            value = context.execute(argv)
+        except (Exception, SystemExit) as exception:
+            error = exception
+        finally:
+            sys.stdout, sys.stderr = saved_streams
+            sys.argv = saved_argv
+            if os.environ != saved_environ:
+                os.environ.clear()
+                os.environ.update(saved_environ)
+        return self.Outcome(value, error, stdout.getvalue(), stderr.getvalue())
+
+    def simulate_many(self, cases, *, env=None, processes=None):
+        """ Simulate each command line of `cases`,
+            spreading them across `processes` forked workers,
+            which see every action registered so far
+
+            Return a list of `Outcome` in the order of `cases`;
+            values and exceptions which could not be pickled
+            are passed as their `repr`
+        """
+        cases = list(cases)
+        processes = min(processes or os.cpu_count() or 1, len(cases))
+        if processes < 2 or not hasattr(os, 'fork'):
+            return [self.simulate(argv, env=env) for argv in cases]
+
+        children = []
+        for index in range(processes):
+            readable, writable = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    os.close(readable)
+                    with open(writable, 'wb') as pipe:
+                        for argv in cases[index::processes]:
+                            outcome = self.simulate(argv, env=env)
+                            pipe.write(self._pickle_outcome(outcome))
+                    status = 0
+                finally:
+                    os._exit(status)
+            os.close(writable)
+            children.append((pid, readable))
+
+        def collect(child):
+            pid, readable = child
+            outcomes = []
+            with open(readable, 'rb') as pipe:
+                while True:
+                    try:
+                        outcomes.append(pickle.load(pipe))
+                    except EOFError:
+                        break
+            os.waitpid(pid, 0)
+            return outcomes
+
+        results = [None] * len(cases)
+        with ThreadPoolExecutor(max_workers=processes) as pool:
+            for index, outcomes in enumerate(pool.map(collect, children)):
+                if len(outcomes) != len(cases[index::processes]):
+                    raise RuntimeError('a simulating process has died')
+                results[index::processes] = outcomes
+        return results
+
+    @staticmethod
+    def _pickle_outcome(outcome):
+        """ Pickle an `Outcome`, replacing what could not be pickled
+            or unpickled back with its `repr`
+        """
+        try:
+            payload = pickle.dumps(outcome, protocol=4)
+            # like exceptions whose `__init__` takes other arguments
+            # than they pass to `Exception.__init__`
+            pickle.loads(payload)
+            return payload
+        except Exception:
+            error = outcome.error
+            if error is not None:
+                error = RuntimeError(repr(error))
+            return pickle.dumps(outcome._replace(
+                value=repr(outcome.value), error=error), protocol=4)
+
     def default(self, function):
         """ Decorator for a default action
             which is invoked when no other action
             is specified
         """
-        if self.default_action is not None:
+        inherited = (
+            self.parent is not None and
+            self.default_action is self.parent.default_action)
+        if self.default_action is not None and not inherited:
             raise TypeError('there could be at most one default action')
 
         self.default_action = self._make_action(function)
         return self.default_action
 
+    def concurrent(self, action):
+        """ Decorator making an action convert its positionals
+            and keys concurrently before it is invoked;
+            goes on top of `@action`
+        """
+        deferred = []
+
+        arguments = self.OrderedDict()
+        for name, annotation in action.arguments.items():
+            if not isinstance(annotation, self.Lazy):
+                annotation = self.Lazy(annotation)
+                deferred.append(name)
+            arguments[name] = annotation
+
+        options = {}
+        for name, mapper in action.options.items():
+            if (
+                isinstance(mapper, self.Key) and
+                not isinstance(mapper.type, self.Lazy)
+            ):
+                mapper = copy(mapper)
+                mapper.type = self.Lazy(mapper.type)
+                deferred.append(name)
+            options[name] = mapper
+
+        # lookup structures cached for the former mappers
+        for attribute in ('_index', '_names', '_vocabulary'):
+            action.__dict__.pop(attribute, None)
+
+        action.arguments = arguments
+        action.options = options
+        action.deferred = tuple(deferred)
+        return action
+
+    def streaming(self, action=None, *, terminator='\n', batch=1 << 16):
+        """ Decorator making `execute` write out items
+            of an iterable returned by the action,
+            each followed by `terminator`, in writes of about
+            `batch` characters; goes on top of `@action`
+        """
+        if action is None:
+            return lambda action: self.streaming(
+                action, terminator=terminator, batch=batch)
+
+        action.streaming = (terminator, batch)
+        return action
+
+    def cached(
+        self, action=None,
+        *, inputs=(), directory=None, size=1 << 26
+    ):
+        """ Decorator storing results of an action on disk
+            keyed by its parsed arguments; goes on top of `@action`
+
+            inputs -- names of arguments holding paths to files
+                      whose size and modification time
+                      should be a part of the key
+            directory -- where to keep results,
+                         `~/.cache/action` by default
+            size -- how many bytes of results to keep at most,
+                    evicting the least recently used ones
+        """
+        if action is None:
+            return lambda action: self.cached(
+                action, inputs=inputs, directory=directory, size=size)
+
+        if directory is None:
+            directory = os.path.join(
+                os.environ.get('XDG_CACHE_HOME') or
+                os.path.expanduser('~/.cache'),
+                'action')
+        action.cache = self._Cache(
+            directory, size, tuple(inputs),
+            self._Cache.fingerprint(action.__wrapped__.__code__))
+        return action
+
     def execute(self, argv):
         """ Act as per arguments
         """
@@ -141,7 +1018,931 @@ class Action(object):
         if type(argv) is not list:
             raise TypeError('argv should be a list')
 
-        action = None
+        if self.recording is None:
+            return self._execute(argv)
+        received = list(argv)
+        started = time.perf_counter()
+        try:
+            return self._execute(argv)
+        finally:
+            self._record(received, time.perf_counter() - started)
+
+    def _execute(self, argv):
+        """ Act as per a list of arguments, which is consumed
+        """
+        with ExitStack() as diagnostics:
+            invocations = self._bind_all(argv, diagnostics)
+            if len(invocations) == 1:
+                action, args, leftover, keywords = invocations[0]
+                return self._invoke(action, args, leftover, **keywords)
+            return self._execute_chain(invocations)
+
+    def _bind_all(self, argv, diagnostics=None):
+        """ Take diagnostic options out of `argv`,
+            entering them into `diagnostics` if given,
+            then bind every invocation chained in `argv`
+
+            Return a list of quadruples of
+                the action,
+                keyword arguments for it,
+                positionals to be passed after the matched ones,
+                and keyword arguments for `_invoke`;
+            if binding fails, arguments bound so far are released
+        """
+        if self.diagnostics:
+            self._diagnose(argv, diagnostics)
+
+        invocations = []
+        try:
+            for segment in self._split_chain(argv):
+                started = time.perf_counter_ns()
+                action = self._select_action(segment)
+                refresh = (
+                    getattr(action, 'cache', None) is not None and
+                    self._take_switch(segment, '--no-cache'))
+                args, leftover = self._bind_arguments(action, segment)
+                invocations.append((
+                    action, args, leftover,
+                    {'refresh': refresh,
+                     'parse_ns': time.perf_counter_ns() - started}))
+        except BaseException:
+            for _, args, _, _ in invocations:
+                self._release(args)
+            raise
+        return invocations
+
+    def _split_chain(self, argv):
+        """ Split `argv` into segments at delimiters before `--`,
+            dropping empty segments of a chain;
+            return `[argv]` if there are no such delimiters,
+            and a single empty segment if all of them are empty
+        """
+        try:
+            dash_dash_index = argv.index('--')
+        except ValueError:
+            dash_dash_index = len(argv)
+        if (
+            self.delimiter is None or
+            self.delimiter not in argv[:dash_dash_index]
+        ):
+            return [argv]
+
+        segments = [[]]
+        for arg in argv[:dash_dash_index]:
+            if arg == self.delimiter:
+                segments.append([])
+            else:
+                segments[-1].append(arg)
+        segments[-1] += argv[dash_dash_index:]
+        # an empty command line selects the default action or fails
+        return [segment for segment in segments if segment] or [[]]
+
+    def invoke(self, name, *positionals, **options):
+        """ Call an action the way `execute` would,
+            taking positionals and options already split apart,
+            like from a decoded JSON request
+
+            Positionals are converted by annotations of the action,
+            and each option value is passed to its mapper
+            as if it was given on the command line:
+            a bool or a number of occurrences for options
+            which take no argument, like `Flag` and `Count`,
+            and a value or a list of values for the rest
+
+            Raise `RuntimeError` if there is no such action
+        """
+        started = time.perf_counter_ns()
+        action = self.actions.get(name)
+        if action is None:
+            raise RuntimeError('no such action: `{}`{}'.format(
+                name, self._suggest(name, self._action_vocabulary())))
+
+        if len(positionals) > len(action.arguments) and (
+                not action.is_variadic):
+            raise TypeError('too many arguments')
+        args = {}
+        leftover = list(positionals[len(action.arguments):])
+        try:
+            for arg, (argname, mapper) in zip(
+                    positionals, action.arguments.items()):
+                args[argname] = mapper.__call__(arg)
+
+            for key, value in options.items():
+                mapper = action.options.get(key)
+                if mapper is None:
+                    raise TypeError('no such option: `{}`{}'.format(
+                        key, self._suggest(
+                            key, self._Vocabulary(action.options))))
+                if mapper.type is None:
+                    for _ in range(int(value)):
+                        self._fold(args, key, mapper, None)
+                elif isinstance(value, (list, tuple)):
+                    for each in value:
+                        self._fold(args, key, mapper, each)
+                else:
+                    self._fold(args, key, mapper, value)
+                if isinstance(mapper, self.Accumulator) and key in args:
+                    args[key] = mapper.finish(args[key])
+        except BaseException:
+            # files opened for arguments converted so far
+            self._release(args)
+            raise
+
+        if getattr(action, 'deferred', ()):
+            self._convert_concurrently(action, args)
+        return self._invoke(
+            action, args, leftover,
+            parse_ns=time.perf_counter_ns() - started)
+
+    def independent(self, action):
+        """ Decorator letting an action run concurrently
+            with its neighbours in a chain of invocations;
+            goes on top of `@action`
+        """
+        action.independent = True
+        return action
+
+    def _execute_chain(self, invocations):
+        """ Run invocations bound by `_bind_all` in order,
+            running adjacent independent ones concurrently
+
+            Return the first result other than None or zero,
+            so that it could serve as an exit status of the whole chain
+        """
+        status = None
+        done = 0
+        try:
+            while done < len(invocations):
+                batch = invocations[done:done + 1]
+                while (
+                    getattr(batch[0][0], 'independent', False) and
+                    done + len(batch) < len(invocations) and
+                    getattr(
+                        invocations[done + len(batch)][0],
+                        'independent', False)
+                ):
+                    batch.append(invocations[done + len(batch)])
+                done += len(batch)
+                for result in self._run_batch(batch):
+                    if status is None and result not in (None, 0):
+                        status = result
+        finally:
+            # bound to arguments, but never to run
+            for _, args, _, _ in invocations[done:]:
+                self._release(args)
+        return status
+
+    def _run_batch(self, batch):
+        """ Invoke actions of a batch, concurrently if there are many,
+            and return their results in order
+        """
+        if len(batch) == 1:
+            action, args, leftover, keywords = batch[0]
+            return [self._invoke(action, args, leftover, **keywords)]
+
+        with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+            futures = [
+                pool.submit(self._invoke, action, args, leftover, **keywords)
+                for action, args, leftover, keywords in batch]
+        return [future.result() for future in futures]
+
+    def validate(self, records):
+        """ Check command lines without executing them
+
+            records -- file-like object or any other iterable
+                       yielding one command line per item
+
+            Yield for each record either `Invocation`
+            with the action and arguments it would be called with,
+            one for each invocation of a chain,
+            or `Failure` listing every error found in that record
+        """
+        shlex = type(self).shlex
+
+        for number, line in enumerate(records, 1):
+            errors = []
+            bound = []
+            try:
+                argv = shlex.split(line)
+                if self.diagnostics:
+                    self._diagnose(argv, None)
+                for segment in self._split_chain(argv):
+                    try:
+                        bound.append(self._bind(segment, errors))
+                    except Exception as error:
+                        errors.append(error)
+            except Exception as error:
+                errors.append(error)
+            try:
+                if errors:
+                    yield self.Failure(number, line, errors)
+                else:
+                    for action, args, leftover in bound:
+                        yield self.Invocation(
+                            number, action, args, leftover)
+            finally:
+                for _, args, _ in bound:
+                    self._release(args)
+
+    def _invoke(
+        self, action, args, leftover,
+        *, refresh=False, parse_ns=None
+    ):
+        """ Call an action with arguments made by `_bind`,
+            filling in defaults from factories
+
+            refresh -- do not look up a cached result
+            parse_ns -- how long it took to make the arguments,
+                        for usage statistics
+        """
+        started = time.perf_counter_ns()
+        succeeded = False
+        try:
+            result = self._invoke_uncounted(action, args, leftover, refresh)
+            succeeded = True
+            return result
+        finally:
+            if self.statistics is not None and parse_ns is not None:
+                self._count(
+                    action, parse_ns, time.perf_counter_ns() - started,
+                    succeeded)
+
+    def _invoke_uncounted(self, action, args, leftover, refresh):
+        try:
+            key = None
+            cache = getattr(action, 'cache', None)
+            if cache is not None:
+                key = cache.key(action, args, leftover)
+                if key is not None and not refresh:
+                    found, result = cache.load(key)
+                    if found:
+                        return self._emit(action, result)
+
+            for name, factory in getattr(action, 'factories', ()):
+                if name not in args:
+                    args[name] = factory.make()
+            result = action.__call__(*leftover, **args)
+
+            if key is not None:
+                cache.store(key, result)
+            return self._emit(action, result)
+        finally:
+            self._release(args)
+
+    _usage_header = struct.Struct('<QQd?H')
+    _recording_header = struct.Struct('<Id')
+
+    def _record(self, argv, elapsed):
+        """ Append a command line and seconds it took to execute
+            to the recording file
+        """
+        payload = ''.join(arg + '\0' for arg in argv).encode(
+            'utf-8', 'surrogateescape')
+        record = self._recording_header.pack(len(payload), elapsed) + payload
+        self._append(self.recording, record)
+
+    def recorded(self, path):
+        """ Yield pairs of a command line from a recording file
+            and seconds it took to execute when recorded
+        """
+        header = self._recording_header
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                offset = 0
+                while offset + header.size <= len(log):
+                    length, elapsed = header.unpack_from(log, offset)
+                    offset += header.size
+                    if offset + length > len(log):
+                        # a record being appended right now
+                        break
+                    payload = log[offset:offset + length]
+                    offset += length
+                    argv = payload.decode('utf-8', 'surrogateescape')
+                    yield argv.split('\0')[:-1], elapsed
+
+    def replay(self, path, *, execute=False):
+        """ Feed command lines from a recording file through this parser
+
+            execute -- run actions as well, instead of only
+                       selecting them and converting arguments
+
+            Return `Replay` of how many command lines there were,
+            how many of them failed, seconds taken to replay them,
+            and seconds they took when recorded
+        """
+        count = failures = 0
+        recorded = 0.0
+        started = time.perf_counter()
+        for argv, elapsed in self.recorded(path):
+            count += 1
+            recorded += elapsed
+            try:
+                if execute:
+                    self._execute(argv)
+                else:
+                    for _, args, _, _ in self._bind_all(argv):
+                        self._release(args)
+            except Exception:
+                failures += 1
+        return self.Replay(
+            count, failures, time.perf_counter() - started, recorded)
+
+    def _count(self, action, parse_ns, run_ns, succeeded):
+        """ Append a record about an invocation
+            to the usage statistics file:
+            parse and run times, a timestamp, whether it failed,
+            and the length-prefixed action name
+        """
+        name = action.__name__.encode('utf-8')[:0xffff]
+        record = self._usage_header.pack(
+            parse_ns, run_ns, time.time(), not succeeded, len(name)) + name
+        self._append(self.statistics, record)
+
+    @staticmethod
+    def _append(path, record):
+        """ Append a record to a file, if it could be done at all;
+            statistics and recordings should never change
+            the outcome of a command
+        """
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except OSError:
+            return
+        try:
+            # a single write of a small record to a file opened for
+            # appending does not interleave with writes of other processes
+            os.write(fd, record)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def usage(self, path):
+        """ Summarize a usage statistics file
+
+            Return a dict mapping action names to `Usage`
+            with the count of invocations, how many of them failed,
+            50th, 95th and 99th percentiles of parse and run times
+            in nanoseconds, and a histogram of run times
+            mapping powers of two of microseconds to counts
+        """
+        header = self._usage_header
+        parse_times = collections.defaultdict(list)
+        run_times = collections.defaultdict(list)
+        failures = collections.Counter()
+        names = {}
+
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return {}
+            with mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                offset = 0
+                while offset + header.size <= len(log):
+                    parse_ns, run_ns, _, failed, length = (
+                        header.unpack_from(log, offset))
+                    offset += header.size
+                    if offset + length > len(log):
+                        # a record being appended right now
+                        break
+                    name = log[offset:offset + length]
+                    offset += length
+                    name = names.get(name) or names.setdefault(
+                        name, name.decode('utf-8', 'replace'))
+                    parse_times[name].append(parse_ns)
+                    run_times[name].append(run_ns)
+                    failures[name] += failed
+
+        def percentiles(times):
+            times.sort()
+            return tuple(
+                times[max(0, -(-len(times) * percent // 100) - 1)]
+                for percent in (50, 95, 99))
+
+        summary = {}
+        for name, times in run_times.items():
+            histogram = collections.Counter(
+                1 << (each // 1000).bit_length() for each in times)
+            summary[name] = self.Usage(
+                len(times), failures[name],
+                percentiles(parse_times[name]), percentiles(times),
+                dict(sorted(histogram.items())))
+        return summary
+
+    def _emit(self, action, result):
+        """ Return what the action returned,
+            unless it is to be streamed to standard output
+        """
+        streaming = getattr(action, 'streaming', None)
+        if (
+            streaming is None or
+            isinstance(result, (str, bytes, bytearray)) or
+            not isinstance(result, collections.abc.Iterable)
+        ):
+            # like `None` or an exit status
+            return result
+        self._drain(result, *streaming)
+
+    def _drain(self, items, terminator, batch):
+        """ Write items to standard output in large chunks,
+            stopping quietly if the reading end has gone away;
+            bytes are written as they are, anything else as `str`
+        """
+        chunk = []
+        size = 0
+        binary = False
+
+        def write():
+            if not binary:
+                chunk.append('')
+                sys.stdout.write(terminator.join(chunk))
+                return
+            chunk.append(b'')
+            data = terminator.encode('utf-8').join(chunk)
+            buffer = getattr(sys.stdout, 'buffer', None)
+            if buffer is None:
+                # like `io.StringIO`
+                sys.stdout.write(data.decode('utf-8', 'surrogateescape'))
+                return
+            # text written so far should come out first
+            sys.stdout.flush()
+            buffer.write(data)
+
+        try:
+            for item in items:
+                if isinstance(item, (bytes, bytearray)) != binary:
+                    if chunk:
+                        write()
+                        chunk.clear()
+                        size = 0
+                    binary = not binary
+                if not binary and not isinstance(item, str):
+                    item = str(item)
+                chunk.append(item)
+                size += len(item) + len(terminator)
+                if size >= batch:
+                    write()
+                    chunk.clear()
+                    size = 0
+            if chunk:
+                write()
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # like when piped into `head`;
+            # there is nobody to flush the rest to on exit either
+            try:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+                os.close(devnull)
+            except (AttributeError, OSError, ValueError):
+                pass
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+
+    def _release(self, args):
+        """ Close files opened for arguments by annotations
+            like `MappedFile` and `InputStream`,
+            and shut down pools of `Executor`
+        """
+        resources = (self.MappedFile, self.InputStream, self._Pool)
+        for value in args.values():
+            if isinstance(value, self.Thunk):
+                if not value.evaluated:
+                    continue
+                value = value.__call__()
+            if not isinstance(value, (tuple, frozenset, list, set)):
+                # lists and sets are yet to be finished by accumulators
+                value = (value,)
+            for each in value:
+                if isinstance(each, resources):
+                    try:
+                        each.close()
+                    except BufferError:
+                        # the action kept a view into the mapping;
+                        # it shall be unmapped once that view is gone
+                        pass
+
+    def _bind(self, argv, errors=None):
+        """ Select an action for `argv` and parse the rest of it
+
+            Return a triple of
+                the action,
+                keyword arguments for it,
+                and positionals to be passed after the matched ones
+
+            errors -- if a list, problems are appended to it
+                      instead of being raised, wherever
+                      parsing could go on past them
+        """
+        action = self._select_action(argv)
+        if getattr(action, 'cache', None) is not None:
+            self._take_switch(argv, '--no-cache')
+        return (action,) + self._bind_arguments(action, argv, errors)
+
+    def _bind_arguments(self, action, argv, errors=None):
+        """ Parse `argv` for an already selected action
+
+            Return a pair of
+                keyword arguments for the action
+                and positionals to be passed after the matched ones
+        """
+        args, leftover = self._parse_command_line(action, argv, errors)
+        if leftover and not action.is_variadic:
+            try:
+                self._complain_about_leftover(action, argv, leftover, errors)
+            except BaseException:
+                self._release(args)
+                raise
+        if getattr(action, 'deferred', ()):
+            self._convert_concurrently(action, args, errors)
+
+        return args, leftover
+
+    def _take_switch(self, argv, switch):
+        """ Remove occurrences of `switch` before `--` from `argv`
+            and tell whether there were any
+        """
+        return len(self._take_option(argv, switch)) > 0
+
+    def _take_option(self, argv, option):
+        """ Remove occurrences of a long `option` before `--`
+            from `argv`, either bare or with a value after `=`
+
+            Return a list of values, with None for bare occurrences
+        """
+        try:
+            dash_dash_index = argv.index('--')
+        except ValueError:
+            dash_dash_index = len(argv)
+        prefix = option + '='
+        values = []
+        head = []
+        for arg in argv[:dash_dash_index]:
+            if arg == option:
+                values.append(None)
+            elif arg.startswith(prefix):
+                values.append(arg[len(prefix):])
+            else:
+                head.append(arg)
+        if values:
+            argv[:dash_dash_index] = head
+        return values
+
+    def _diagnose(self, argv, stack):
+        """ Take `--profile`, `--trace-malloc` and `--measure`
+            out of `argv` and enter respective context managers
+            into `stack`, unless it is None;
+            each takes an optional file name after `=`
+        """
+        for option, manager in (
+            ('--measure', self._measuring),
+            ('--trace-malloc', self._tracing_malloc),
+            ('--profile', self._profiling),
+        ):
+            for destination in self._take_option(argv, option):
+                if stack is not None:
+                    stack.enter_context(manager(destination))
+
+    @contextmanager
+    def _profiling(self, destination):
+        """ Run the body under cProfile,
+            then dump statistics into `destination`
+            or print the hottest functions to stderr
+        """
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if destination is not None:
+                profile.dump_stats(destination)
+            else:
+                stats = pstats.Stats(profile, stream=sys.stderr)
+                stats.sort_stats('cumulative').print_stats(30)
+
+    @contextmanager
+    def _tracing_malloc(self, destination):
+        """ Trace allocations made by the body
+            and report the lines allocating the most
+        """
+        import tracemalloc
+
+        tracemalloc.start(16)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            lines = ['current {} B, peak {} B'.format(current, peak)]
+            for statistic in snapshot.statistics('lineno')[:30]:
+                lines.append(str(statistic))
+            self._report(destination, lines)
+
+    @contextmanager
+    def _measuring(self, destination):
+        """ Report wall time, CPU time and peak resident memory
+            spent on the body
+        """
+        try:
+            import resource
+        except ImportError:
+            resource = None
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            lines = [
+                'wall {:.6f} s'.format(time.perf_counter() - wall),
+                'cpu {:.6f} s'.format(time.process_time() - cpu),
+            ]
+            if resource is not None:
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                # kilobytes everywhere but on macOS
+                if sys.platform != 'darwin':
+                    peak *= 1024
+                lines.append('peak rss {} B'.format(peak))
+            self._report(destination, lines)
+
+    @staticmethod
+    def _report(destination, lines):
+        """ Write lines into the file named `destination`,
+            or to stderr if it is None
+        """
+        text = ''.join(line + '\n' for line in lines)
+        if destination is None:
+            sys.stderr.write(text)
+            return
+        with open(destination, 'w') as file:
+            file.write(text)
+
+    def _convert_concurrently(self, action, args, errors=None):
+        """ Evaluate thunks for deferred arguments on a thread pool,
+            reporting errors in the order of arguments;
+            if an error is raised, every argument is released
+        """
+        pending = [
+            (name, args[name])
+            for name in getattr(action, 'deferred', ()) if name in args]
+        if not pending:
+            return
+
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futures = [pool.submit(thunk) for _, thunk in pending]
+        for (name, _), future in zip(pending, futures):
+            try:
+                args[name] = future.result()
+            except Exception as error:
+                del args[name]
+                if errors is None:
+                    # other thunks might have opened files already
+                    self._release(args)
+                self._fail(errors, error)
+
+    def watch(self, argv, paths, *, debounce=0.1, interval=0.5, runs=None):
+        """ Execute a command line, then execute it again
+            each time some of the files or directories change,
+            all in the same process
+
+            paths -- files and directories to watch
+            debounce -- how long changes should settle before a run
+            interval -- how often to look at files
+                        if they could not be watched through inotify
+            runs -- stop after that many runs
+        """
+        shlex = type(self).shlex
+
+        if type(argv) is str:
+            argv = shlex.split(argv)
+        if type(argv) is not list:
+            raise TypeError('argv should be a list')
+        argv = list(argv)
+        action = self._select_action(argv)
+        refresh = (
+            getattr(action, 'cache', None) is not None and
+            self._take_switch(argv, '--no-cache'))
+
+        watcher = self._Watcher(paths, interval)
+        try:
+            count = 0
+            while True:
+                # converters read the very files being watched,
+                # so arguments are converted anew for each run
+                try:
+                    args, leftover = self._bind_arguments(action, list(argv))
+                    result = self._invoke(
+                        action, args, leftover, refresh=refresh)
+                except Exception as error:
+                    print('{}: {}'.format(type(error).__name__, error),
+                          file=sys.stderr)
+                else:
+                    if result is not None:
+                        print(result)
+                count += 1
+                if runs is not None and count >= runs:
+                    return
+
+                watcher.wait()
+                while watcher.wait(debounce):
+                    pass
+        finally:
+            watcher.close()
+
+    def repl(self, prompt='> ', *, lines=None):
+        """ Execute command lines one by one until end of input,
+            reporting errors without leaving the loop
+
+            prompt -- shown before each line read from the terminal
+            lines -- iterable of lines to use instead of the terminal
+        """
+        if lines is None:
+            lines = self._prompt_lines(prompt)
+
+        for line in lines:
+            try:
+                argv = list(self._tokenize(line))
+                if not argv:
+                    continue
+                result = self.execute(argv)
+            except Exception as error:
+                print('{}: {}'.format(type(error).__name__, error),
+                      file=sys.stderr)
+                continue
+            if result is not None:
+                print(result)
+
+    def _prompt_lines(self, prompt):
+        """ Yield lines typed in the terminal,
+            completing action and option names if possible
+        """
+        try:
+            import readline
+        except ImportError:
+            readline = None
+
+        if readline is not None:
+            previous_completer = readline.get_completer()
+            previous_delims = readline.get_completer_delims()
+            completions = []
+
+            def complete(text, state):
+                if state == 0:
+                    completions[:] = self._complete(
+                        readline.get_line_buffer()[:readline.get_begidx()],
+                        text)
+                if state < len(completions):
+                    return completions[state]
+                return None
+
+            readline.set_completer(complete)
+            readline.set_completer_delims(' \t\n=')
+            readline.parse_and_bind('tab: complete')
+
+        try:
+            while True:
+                try:
+                    yield input(prompt)
+                except KeyboardInterrupt:
+                    print()
+                except EOFError:
+                    print()
+                    return
+        finally:
+            if readline is not None:
+                readline.set_completer(previous_completer)
+                readline.set_completer_delims(previous_delims)
+
+    def _complete(self, head, text):
+        """ Return names that could follow `head`
+            and start with `text`
+        """
+        words = self._tokenize(head) if head.strip() else ()
+        if not words and not text.startswith('-'):
+            return self._prefixed(self._action_names(), text)
+
+        action = self.actions.get(words[0]) if words else None
+        if action is None:
+            action = self.default_action
+        else:
+            words = words[1:]
+        if action is None:
+            return []
+        if text.startswith('-'):
+            return self._prefixed(self._option_names(action), text)
+
+        converter = self._expected_converter(action, head, words)
+        if isinstance(converter, self.Choice):
+            return converter.complete(text)
+        return []
+
+    def _expected_converter(self, action, head, words):
+        """ Return the converter for a word following `head`,
+            where `words` are those of `head` after the action name,
+            looking through conversions postponed with `Lazy`
+        """
+        converter = self._expected_annotation(action, head, words)
+        while isinstance(converter, self.Lazy):
+            converter = converter.converter
+        return converter
+
+    def _expected_annotation(self, action, head, words):
+        """ Return the annotated type of a word following `head`
+        """
+        shorts, longs = self._option_index(action)
+        last = words[-1] if words else ''
+        if head.endswith('=') and self._is_long_option(last):
+            # `--region=`
+            found = longs.get(last[len('--'):-len('=')])
+            return found and found[1].type
+        found = None
+        if self._is_long_option(last) and '=' not in last:
+            # `--region `
+            found = longs.get(last[len('--'):])
+        elif self._is_option(last):
+            # `-r `
+            found = shorts.get(last[-1])
+        if found and found[1].type is not None:
+            return found[1].type
+
+        # count positionals, skipping arguments of preceding options
+        position = 0
+        taken = False
+        for word in words:
+            if taken:
+                taken = False
+            elif self._is_long_option(word):
+                found = longs.get(word[len('--'):])
+                taken = bool(found and found[1].type is not None)
+            elif self._is_option(word):
+                found = shorts.get(word[-1])
+                taken = bool(found and found[1].type is not None)
+            else:
+                position += 1
+        converters = list(action.arguments.values())
+        if position < len(converters):
+            return converters[position]
+        return None
+
+    def _action_names(self):
+        """ Return sorted names of registered actions,
+            sorting them anew if the registry has changed since
+        """
+        stamp = (id(self.actions), len(self.actions))
+        if self._names is None or self._names[0] != stamp:
+            self._names = (stamp, sorted(self.actions))
+        return self._names[1]
+
+    def _option_names(self, action):
+        """ Return sorted option spellings accepted by the action,
+            caching them on the action
+        """
+        names = getattr(action, '_names', None)
+        if names is None:
+            names = []
+            for mapper in action.options.values():
+                if mapper.short:
+                    names.append('-' + mapper.short)
+                if mapper.long:
+                    names.append('--' + mapper.long)
+            names.sort()
+            action._names = names
+        return names
+
+    @staticmethod
+    def _prefixed(names, prefix):
+        """ Return elements of sorted `names` starting with `prefix`
+        """
+        start = bisect_left(names, prefix)
+        stop = start
+        while stop < len(names) and names[stop].startswith(prefix):
+            stop += 1
+        return names[start:stop]
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _tokenize(line):
+        """ Split a command line into a tuple of words
+        """
+        return tuple(shlex.split(line))
+
+    def _select_action(self, argv):
+        """ Find an action named by the first positional of `argv`
+            and remove that name from `argv`;
+            fall back to the default action if there is one
+
+            Raise `RuntimeError` if no action could be selected
+        """
         first_positional = None
         positionals = filter(lambda x: not x.startswith('-'), argv)
         for positional in positionals:
@@ -149,20 +1950,78 @@ class Action(object):
             break
         if first_positional in self.actions:
             argv.remove(first_positional)
-            action = self.actions[first_positional]
+            return self.actions[first_positional]
         elif self.default_action is not None:
-            action = self.default_action
+            return self.default_action
         elif first_positional and len(first_positional) > 0:
             raise RuntimeError(
-                'no such action: `{}`'.format(first_positional))
+                'no such action: `{}`{}'.format(
+                    first_positional,
+                    self._suggest(
+                        first_positional, self._action_vocabulary())))
         else:
             raise RuntimeError('no action specified')
 
-        args, leftover = self._parse_command_line(action, argv)
-        if leftover and not action.is_variadic:
-            raise TypeError('too many arguments')
+    def _complain_about_leftover(self, action, argv, leftover, errors=None):
+        """ Raise `TypeError` explaining why `leftover`
+            could not be passed to a non-variadic action;
+            if `errors` is a list, record every such reason there
+        """
+        try:
+            dash_dash_index = argv.index('--')
+        except ValueError:
+            dash_dash_index = len(argv)
+        before_dash_dash = set(argv[:dash_dash_index])
+        leftover_options = 0
+        for arg in leftover:
+            if not self._is_option(arg):
+                continue
+            if dash_dash_index < len(argv) and (
+                    arg not in before_dash_dash):
+                # came after `--`, so it was meant as a positional
+                continue
+            if self._is_long_option(arg):
+                key = arg.split('=', 1)[0]
+            else:
+                key = arg[:2]
+            self._fail(errors, TypeError('no such option: `{}`{}'.format(
+                key, self._suggest(key, self._option_vocabulary(action)))))
+            if errors is None:
+                return
+            leftover_options += 1
+        if leftover_options < len(leftover):
+            self._fail(errors, TypeError('too many arguments'))
+
+    def _action_vocabulary(self):
+        """ Return a `_Vocabulary` of registered action names,
+            building it anew if the registry has changed since
+        """
+        stamp = (id(self.actions), len(self.actions))
+        if self._vocabulary is None or self._vocabulary[0] != stamp:
+            self._vocabulary = (stamp, self._Vocabulary(self.actions))
+        return self._vocabulary[1]
+
+    def _option_vocabulary(self, action):
+        """ Return a `_Vocabulary` of option spellings
+            accepted by the action, caching it on the action
+        """
+        vocabulary = getattr(action, '_vocabulary', None)
+        if vocabulary is None:
+            vocabulary = self._Vocabulary(self._option_names(action))
+            action._vocabulary = vocabulary
+        return vocabulary
 
-        return action.__call__(*leftover, **args)
+    @staticmethod
+    def _suggest(word, vocabulary):
+        """ Return a clause to be appended to an error message
+            naming the closest known words, or an empty string
+        """
+        radius = max(1, len(word.lstrip('-')) // 3)
+        matches = vocabulary.search(word, radius)[:3]
+        if not matches:
+            return ''
+        return '; did you mean {}?'.format(
+            ' or '.join('`{}`'.format(match) for match in matches))
 
     def _make_action(self, function):
         """ Iterate through function type annotations
@@ -184,44 +2043,97 @@ class Action(object):
 
         code = function.__code__
         args = code.co_varnames[:code.co_argcount]
-        kwargs = code.co_varnames[-code.co_kwonlyargcount:]
+        kwonly = code.co_varnames[
+            code.co_argcount:code.co_argcount + code.co_kwonlyargcount]
+        # without keyword-only arguments,
+        # positionals could be given as options as well
+        kwargs = kwonly or args
         annotations = function.__annotations__
+        defaults = function.__defaults__ or ()
+        kwdefaults = function.__kwdefaults__ or {}
 
         for argname in args:
             # positional arguments are taken from function arguments
             annotation = annotations.get(argname, str)
             if not callable(annotation):
                 raise TypeError('annotation should be callable')
+            if isinstance(annotation, self.Choice):
+                annotation.prepare()
             arguments[argname] = annotation
 
         for optname in kwargs:
             # options are derived from function kw-only arguments
             annotation = annotations.get(optname)
             mapper = self._normalize_annotation(optname, annotation)
+            if isinstance(mapper.type, self.Choice):
+                mapper.type.prepare()
             options[optname] = mapper
 
         action.options = options
         action.arguments = arguments
-        action.is_variadic = len(code.co_varnames) > code.co_argcount
+        action.is_variadic = bool(code.co_flags & CO_VARARGS)
+        # attributes set by decorators, like `streaming`, `deferred`,
+        # `cache` or `independent`, are left unset unless used,
+        # as there could be many thousands of actions
+        # pools are passed even when `--jobs` is not given
+        executors = tuple(
+            (name, self.Factory(mapper.default))
+            for name, mapper in options.items()
+            if isinstance(mapper, self.Executor))
+        factories = tuple(
+            (name, default) for name, default in chain(
+                zip(args[len(args) - len(defaults):], defaults),
+                kwdefaults.items())
+            if isinstance(default, self.Factory)) + executors
+        if factories:
+            action.factories = factories
 
         return action
 
-    def _parse_command_line(self, action, argv):
+    @staticmethod
+    def _required(action):
+        """ Return names of arguments the action
+            could not be called without,
+            caching them on the action, as only `validate` needs them
+        """
+        required = getattr(action, '_required', None)
+        if required is None:
+            function = action.__wrapped__
+            code = function.__code__
+            args = code.co_varnames[:code.co_argcount]
+            kwonly = code.co_varnames[
+                code.co_argcount:code.co_argcount + code.co_kwonlyargcount]
+            defaults = function.__defaults__ or ()
+            kwdefaults = function.__kwdefaults__ or {}
+            required = frozenset(
+                args[:len(args) - len(defaults)] +
+                tuple(name for name in kwonly if name not in kwdefaults)
+            ).difference(
+                name for name, _ in getattr(action, 'factories', ()))
+            action._required = required
+        return required
+
+    def _parse_command_line(self, action, argv, errors=None):
         """ Make arguments dict for supplied action
 
             Return pair of
                 arguments dict for action
                 and unconsumed args
         """
-        opts, positionals = self._parse_options(action, argv)
-        args, leftover = self._parse_arguments(action, positionals)
+        opts, positionals = self._parse_options(action, argv, errors)
+        try:
+            args, leftover = self._parse_arguments(
+                action, positionals, errors, given=opts)
+        except BaseException:
+            self._release(opts)
+            raise
 
         call = {}
         call.update(opts)
         call.update(args)
         return call, leftover
 
-    def _parse_options(self, action, argv):
+    def _parse_options(self, action, argv, errors=None):
         """ Return a pair whose
             first element is populated dict of options,
             and the second element is part of argv left untouched
@@ -251,117 +2163,187 @@ class Action(object):
         firsts, nexts = tee(optargv)
         next(nexts, None)
         pairs = zip(firsts, nexts)
-        for arg, next_arg in pairs:
-            next_arg_used = False
-            if self._is_long_option(arg):
-                next_arg_used = self._consume_long_option(
-                    action, arg, next_arg, options, unconsumed)
-            elif self._is_option(arg):
-                next_arg_used = self._consume_short_option(
-                    action, arg, next_arg, options, unconsumed)
-
-            if (
-                next_arg is not None and
-                not self._is_option(next_arg) and
-                not next_arg_used
-            ):
-                # case like `-h xyz`,
-                # where current option is saturated or takes no args
-                unconsumed.append(next_arg)
+        try:
+            for arg, next_arg in pairs:
+                next_arg_used = False
+                if self._is_long_option(arg):
+                    next_arg_used = self._consume_long_option(
+                        action, arg, next_arg, options, unconsumed, errors)
+                elif self._is_option(arg):
+                    next_arg_used = self._consume_short_option(
+                        action, arg, next_arg, options, unconsumed, errors)
+
+                if (
+                    next_arg is not None and
+                    not self._is_option(next_arg) and
+                    not next_arg_used
+                ):
+                    # case like `-h xyz`,
+                    # where current option is saturated or takes no args
+                    unconsumed.append(next_arg)
+
+            if errors is not None:
+                # without raising, the action would be called anyway,
+                # so report options it could not be called without;
+                # positionals also given as options are reported
+                # as missing arguments, if at all
+                for name in self._required(action):
+                    if (
+                        name in action.options and
+                        name not in action.arguments and
+                        name not in options
+                    ):
+                        errors.append(TypeError('missing option `{}`'.format(
+                            self._spell(action.options[name]))))
+                for name, value in list(options.items()):
+                    if value is self._invalid:
+                        del options[name]
+
+            for name, value in options.items():
+                mapper = action.options[name]
+                if isinstance(mapper, self.Accumulator):
+                    try:
+                        options[name] = mapper.finish(value)
+                    except Exception as error:
+                        self._fail(errors, error)
+        except BaseException:
+            # files opened for options taken so far
+            self._release(options)
+            raise
 
         positionals = unconsumed + positional_only
         return (options, positionals)
 
     def _consume_short_option(
-        self, action, arg, next_arg, opts, unconsumed
+        self, action, arg, next_arg, opts, unconsumed, errors=None
     ):
-        """ Modify `opts` to contain an option from `arg`
+        """ Modify `opts` to contain options from `arg`
             Return True if `next_arg` was used up, False otherwise
         """
-        key = arg[1]  # `arg[0]` is the dash
-        remains = arg[2:]
+        shorts, _ = self._option_index(action)
+
+        # walk along a cluster like `-vvvvvvc32`
+        # until some option takes the rest of it as an argument
+        position = 1  # `arg[0]` is the dash
+        while position < len(arg):
+            key = arg[position]
+            found = shorts.get(key)
+            if found is None:
+                unconsumed.append('-' + arg[position:])
+                return False
+            name, mapper = found
+            position += 1
 
-        name = None
-        mapper = None
-        for each_name, each_mapper in action.options.items():
-            if each_mapper.short == key:
-                name, mapper = each_name, each_mapper
-                break
-        else:
-            unconsumed.append(arg)
-            return False
+            if mapper.type is None:
+                self._fold(opts, name, mapper, None, errors)
+                continue
 
-        old = opts.get(name)
-        if mapper.type is not None:
+            remains = arg[position:]
             if remains:
                 # `-c32`, remains are '32'
-                argvalue = mapper.type.__call__(remains)
-                opts[name] = mapper.__call__(old, argvalue)
+                self._fold(opts, name, mapper, remains, errors)
                 return False
             elif next_arg is not None:
                 # `-c 32`, remains are '', next argument is '32'
-                argvalue = mapper.type.__call__(next_arg)
-                opts[name] = mapper.__call__(old, argvalue)
+                self._fold(opts, name, mapper, next_arg, errors)
                 return True
             else:
-                raise TypeError(
-                    'option `-{}` needs an argument'.format(key))
-        elif remains:
-            # case like `-vvvvvvc32`
-            opts[name] = mapper.__call__(old, None)
-            return self._consume_short_option(
-                action, '-' + remains, next_arg, opts, unconsumed)
-
-        opts[name] = mapper.__call__(old, None)
+                self._fail(errors, TypeError(
+                    'option `-{}` needs an argument'.format(key)))
+                return False
+
         return False
 
     def _consume_long_option(
-        self, action, arg, next_arg, opts, unconsumed
+        self, action, arg, next_arg, opts, unconsumed, errors=None
     ):
         """ Modify `opts` to contain a long option from `arg`
             Return True if `next_arg` was used up, False otherwise
         """
-        arg = arg[len('--'):]
-        key, *value = arg.split('=', 1)
+        _, longs = self._option_index(action)
+        key, *value = arg[len('--'):].split('=', 1)
 
-        name = None
-        mapper = None
-        for this_name, this_mapper in action.options.items():
-            if this_mapper.long == key:
-                name, mapper = this_name, this_mapper
-                break
-        else:
+        found = longs.get(key)
+        if found is None:
             unconsumed.append(arg)
             return False
-
-        old = opts.get(name)
+        name, mapper = found
 
         if mapper.type is not None:
             if value:
                 [value] = value
-                argvalue = mapper.type.__call__(value)
-                opts[name] = mapper.__call__(old, argvalue)
+                self._fold(opts, name, mapper, value, errors)
                 return False
             elif next_arg is not None:
-                argvalue = mapper.type.__call__(next_arg)
-                opts[name] = mapper.__call__(old, argvalue)
+                self._fold(opts, name, mapper, next_arg, errors)
                 return True
             else:
-                raise TypeError(
-                    'option `--{}` requires an argument'.format(key))
+                self._fail(errors, TypeError(
+                    'option `--{}` requires an argument'.format(key)))
+                return False
         elif value:
-            raise TypeError(
-                'option `--{}` does not take arguments'.format(key))
+            self._fail(errors, TypeError(
+                'option `--{}` does not take arguments'.format(key)))
+            return False
 
-        opts[name] = mapper.__call__(old, None)
+        self._fold(opts, name, mapper, None, errors)
         return False
 
-    def _parse_arguments(self, action, argv):
+    @staticmethod
+    def _option_index(action):
+        """ Return a pair of dicts mapping short and long forms
+            to pairs of an option name and its mapper,
+            caching them on the action
+        """
+        index = getattr(action, '_index', None)
+        if index is None:
+            shorts, longs = {}, {}
+            for name, mapper in action.options.items():
+                if mapper.short:
+                    shorts.setdefault(mapper.short, (name, mapper))
+                if mapper.long:
+                    longs.setdefault(mapper.long, (name, mapper))
+            index = (shorts, longs)
+            action._index = index
+        return index
+
+    def _fold(self, opts, name, mapper, new, errors=None):
+        """ Pass another occurrence of an option to its mapper
+        """
+        old = opts.get(name)
+        if old is self._invalid:
+            return
+        try:
+            opts[name] = mapper.__call__(old, new)
+        except Exception as error:
+            self._fail(errors, error)
+            opts[name] = self._invalid
+
+    @staticmethod
+    def _fail(errors, error):
+        """ Raise `error`, or just record it
+            if `errors` are being collected
+        """
+        if errors is None:
+            raise error
+        errors.append(error)
+
+    @staticmethod
+    def _spell(mapper):
+        """ Return the way an option is written on the command line
+        """
+        if mapper.long:
+            return '--' + mapper.long
+        return '-' + mapper.short
+
+    def _parse_arguments(self, action, argv, errors=None, given=()):
         """ Match `argv` to respective fields in `action.arguments`
 
             Return pair of
                 arguments dict
                 and list of unconsumed parts of command line
+
+            given -- names of arguments already given as options
         """
         arguments = {}
         leftover = []
@@ -384,7 +2366,21 @@ class Action(object):
 
         args = zip(positionals, action.arguments.items())
         for arg, (name, mapper) in args:
-            arguments[name] = mapper.__call__(arg)
+            try:
+                arguments[name] = mapper.__call__(arg)
+            except Exception as error:
+                if errors is None:
+                    # files opened for preceding arguments
+                    self._release(arguments)
+                self._fail(errors, error)
+
+        if errors is not None:
+            missing = list(action.arguments)[len(positionals):]
+            required = self._required(action)
+            for name in missing:
+                if name in required and name not in given:
+                    errors.append(TypeError(
+                        'missing argument `{}`'.format(name)))
 
         return arguments, leftover
 
@@ -398,25 +2394,35 @@ class Action(object):
         Option = self.Option
 
         if annotation is None:
-            return Key(name[0], name)
+            return self._shared_mapper(Key, name[0], name)
 
         elif type(annotation) is type:
             long = name.replace('_', '-')
             short = name[0]
-            if issubclass(annotation, Option):
+            if issubclass(annotation, self.Executor):
+                # notation `pool: action.Executor`
+                return self._shared_mapper(annotation, 'j', 'jobs')
+            elif issubclass(annotation, Option):
                 # notation `verbose: action.Count`
-                return annotation(short, long)
+                return self._shared_mapper(annotation, short, long)
             elif issubclass(annotation, bool):
                 # notation `quiet: bool`
-                return Flag(short, long)
+                return self._shared_mapper(Flag, short, long)
             else:
                 # notation `depth: int`
-                return Key(short, long, type=annotation)
+                return self._shared_mapper(
+                    Key, short, long, type=annotation)
 
         elif type(annotation) is tuple and len(annotation) == 3:
             # notation `reset_hard: ('r', 'hard', bool)`
             short, long, mapper = annotation
-            return Key(short, long, type=mapper)
+            return self._shared_mapper(Key, short, long, type=mapper)
+
+        elif isinstance(annotation, (self.Lazy, self.Choice)):
+            # notation `config: action.Lazy(load_json)`
+            # or `region: action.Choice(regions)`
+            return self._shared_mapper(
+                Key, name[0], name.replace('_', '-'), type=annotation)
 
         if isinstance(annotation, Option):
             # notation `follow_symlinks: action.Flag('n', 'follow')`
@@ -427,6 +2433,23 @@ class Action(object):
             ' an instance of action.Option,'
             ' a callable, or a triple (str, str, callable)')
 
+    def _shared_mapper(self, constructor, short, long, **keywords):
+        """ Return `constructor(short, long, **keywords)`,
+            reusing an equal mapper made for another action, if any;
+            mappers are never modified after construction,
+            so actions could share them
+        """
+        key = (constructor, short, long) + tuple(sorted(keywords.items()))
+        try:
+            mapper = self._mappers.get(key)
+        except TypeError:
+            # an unhashable `type`; such mappers are not shared
+            return constructor(short, long, **keywords)
+        if mapper is None:
+            mapper = constructor(short, long, **keywords)
+            self._mappers[key] = mapper
+        return mapper
+
     @staticmethod
     def _is_long_option(s):
         """ True iff a string starts with a double dash
@@ -442,5 +2465,42 @@ class Action(object):
         return len(s) > len('-') and s.startswith('-')
 
 
-import sys  # nopep8
 sys.modules[__name__] = Action()
+
+if __name__ == '__main__':
+    tools = Action()
+
+    @tools
+    def stats(path, *, histogram: bool = False):
+        """ Summarize a usage statistics file
+        """
+        for name, usage in sorted(sys.modules[__name__].usage(path).items()):
+            print('{}: {} runs, {} failed'.format(
+                name, usage.count, usage.failures))
+            for phase, times in ('parse', usage.parse), ('run', usage.run):
+                print('  {:5}  p50 {:.3f} ms  p95 {:.3f} ms  p99 {:.3f} ms'
+                      .format(phase, *(each / 1e6 for each in times)))
+            if histogram:
+                for bound, count in usage.histogram.items():
+                    print('  < {:>8} us  {}'.format(bound, count))
+
+    @tools
+    def replay(
+        path, *, module: Action.Append('m', 'module') = (),
+        execute: bool = False
+    ):
+        """ Replay a recording against actions
+            registered by importing each `--module`
+        """
+        import importlib
+        for each in module:
+            importlib.import_module(each)
+        registry = importlib.import_module('action')
+        result = registry.replay(path, execute=execute)
+        print('{} command lines, {} failed'.format(
+            result.count, result.failures))
+        print('{:.3f} s, {:.0f} per second; recorded {:.3f} s'.format(
+            result.elapsed, result.count / (result.elapsed or 1e-9),
+            result.recorded))
+
+    sys.exit(tools.execute(sys.argv[1:]))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+#  Benchmarks for the parser itself.
+#  Run as `./bench.py <benchmark>`, e.g. `./bench.py memory`.
+#
+import os
+import sys
+import time
+import tempfile
+import threading
+import subprocess
+import statistics
+import tracemalloc
+
+import action
+
+
+def _generate_functions(count):
+    """ Make `count` distinct functions
+        with a typical mix of positionals and options
+    """
+    functions = []
+    for i in range(count):
+        namespace = {'action': action}
+        exec(
+            'def command_{}(path, target: int, *,'
+            ' verbose: action.Count = 0, depth: int = 0,'
+            ' name=None, quiet: bool = False):\n'
+            '    pass\n'.format(i),
+            namespace)
+        functions.append(namespace['command_{}'.format(i)])
+    return functions
+
+
+@action
+def memory(*, count: int = 10000):
+    """ Report bytes allocated per registered action
+    """
+    functions = _generate_functions(count)
+    ctx = action.context()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for function in functions:
+        ctx.__call__(function)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('{} actions, {:.0f} bytes per action'.format(
+        count, (after - before) / count))
+
+
+@action
+def noop(*args):
+    """ Do nothing, for timing a fresh process
+    """
+
+
+@action
+def watch(*, runs: int = 20, debounce: float = 0.005):
+    """ Compare latency of a fresh process running an action
+        with latency of a re-run in watch mode
+    """
+    fresh = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'noop'], check=True)
+        fresh.append(time.perf_counter() - start)
+
+    ctx = action.context()
+    ran = threading.Event()
+    reruns = []
+
+    def touched(path):
+        reruns.append(time.perf_counter())
+        ran.set()
+    ctx.__call__(touched)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'input')
+        with open(path, 'w') as file:
+            file.write('0')
+
+        watching = threading.Thread(target=ctx.watch, args=(
+            ['touched', path], [path]),
+            kwargs={'debounce': debounce, 'runs': runs + 1})
+        watching.start()
+        ran.wait()
+
+        warm = []
+        for i in range(1, runs + 1):
+            ran.clear()
+            reruns.clear()
+            start = time.perf_counter()
+            with open(path, 'w') as file:
+                file.write(str(i))
+            ran.wait()
+            warm.append(reruns[0] - start)
+        watching.join()
+
+    print('fresh process: {:.1f} ms median'.format(
+        statistics.median(fresh) * 1000))
+    print('watch re-run:  {:.1f} ms median, {:.1f} ms of which debounce'
+          .format(statistics.median(warm) * 1000, debounce * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(action.execute(sys.argv[1:]))
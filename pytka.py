@@ -5,8 +5,13 @@
 #  by using only end-to-end test
 #  with most tricky inputs.
 #
+import os
 import sys
+import time
 import pytest
+import tracemalloc
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
 from collections import OrderedDict
 
 import action
@@ -236,7 +241,8 @@ def test_representation():
         should be able to introduce itself
     """
     classes = (
-        action.Option, action.Key, action.Count, action.Flag)
+        action.Option, action.Key, action.Count, action.Flag,
+        action.Append, action.Extend, action.Set)
     for construct in classes:
         assert(isinstance(
             repr(construct()),
@@ -255,6 +261,28 @@ def test_representation():
             str))
 
 
+def test_mapper_sharing(ctx):
+    """ Equal mappers derived from annotations
+        should be shared among actions of a context
+    """
+    def one(*, depth: int = 0, name=None, quiet: bool = False):
+        pass
+    one = ctx.__call__(one)
+
+    def two(*, depth: int = 0, name=None, quiet: bool = False):
+        pass
+    two = ctx.__call__(two)
+
+    def three(*, depth: float = 0.0):
+        pass
+    three = ctx.__call__(three)
+
+    for name in ('depth', 'name', 'quiet'):
+        assert(one.options[name] is two.options[name])
+    assert(one.options['depth'] is not three.options['depth'])
+    assert(not hasattr(one.options['depth'], '__dict__'))
+
+
 def test_flags(ctx):
     """ `-q`
     """
@@ -473,6 +501,910 @@ def test_mixed_options_parsing(ctx):
     assert(invocations == [('-long-', '-short-')])
 
 
+def test_accumulators(ctx):
+    """ Repeated options should collect into frozen values,
+        with each value converted exactly once
+    """
+    invocations = []
+    conversions = []
+
+    def tracked(value):
+        conversions.append(value)
+        return int(value)
+
+    def act(
+        *,
+        include: ctx.Append = (),
+        level: ctx.Append('l', 'level', type=tracked) = (),
+        with_: ctx.Extend('w', 'with') = (),
+        tag: ctx.Set = frozenset()
+    ):
+        invocations.append((include, level, with_, tag))
+    act = ctx.__call__(act)
+
+    ctx.execute(
+        'act -ia --include=b -i c'
+        ' -l1 --level 2 --with=ssl,zlib -w bz2 -tx -ty -tx')
+    ctx.execute('act')
+    assert(invocations == [
+        (('a', 'b', 'c'), (1, 2), ('ssl', 'zlib', 'bz2'),
+            frozenset({'x', 'y'})),
+        ((), (), (), frozenset()),
+    ])
+    assert(conversions == ['1', '2'])
+
+
+def test_repl(ctx, capsys):
+    """ Lines should be executed one after another
+        in the same context, surviving errors
+    """
+    invocations = []
+
+    def add(x: int, y: int):
+        invocations.append((x, y))
+        return x + y
+    add = ctx.__call__(add)
+
+    ctx.repl(lines=['add 1 2', '', 'add 1', 'ad 3 4', 'add "5', 'add 3 4'])
+    assert(invocations == [(1, 2), (3, 4)])
+
+    out, err = capsys.readouterr()
+    assert(out == '3\n7\n')
+    assert(err.count('Error: ') == 3)
+    assert('did you mean `add`' in err)
+
+
+def test_repl_completion(ctx):
+    """ Completion should offer action names first
+        and options of the chosen action afterwards
+    """
+    def install(package, *, upgrade: bool = False, verbose: ctx.Count = 0):
+        pass
+    install = ctx.__call__(install)
+
+    def inspect():
+        pass
+    inspect = ctx.__call__(inspect)
+
+    assert(ctx._complete('', 'in') == ['inspect', 'install'])
+    assert(ctx._complete('', 'ins') == ['inspect', 'install'])
+    assert(ctx._complete('', 'inst') == ['install'])
+    assert(ctx._complete('install ', '--') == ['--upgrade', '--verbose'])
+    assert(ctx._complete('install ffmpeg ', '-') == [
+        '--upgrade', '--verbose', '-u', '-v'])
+    assert(ctx._complete('inspect ', '-') == [])
+
+
+def test_validation(ctx):
+    """ Recorded command lines should be checked
+        without running actions, with all errors of a line reported
+    """
+    def copy(source, target: int, *, depth: int = 0, mode):
+        pytest.fail(test_validation.__doc__)
+    copy = ctx.__call__(copy)
+
+    import io
+    records = io.StringIO(
+        'copy a 1 --mode=x\n'
+        'copy a b --depth=z --colour --mode=x --mode=y\n'
+        'cpy a 1\n'
+        'copy a\n')
+    results = list(ctx.validate(records))
+
+    assert([type(each) for each in results] == [
+        ctx.Invocation, ctx.Failure, ctx.Failure, ctx.Failure])
+    assert(results[0].action is copy)
+    assert(results[0].args == {'source': 'a', 'target': 1, 'mode': 'x'})
+
+    assert(results[1].number == 2)
+    assert([type(each) for each in results[1].errors] == [
+        ValueError, RuntimeError, ValueError, TypeError])
+    assert('`--colour`' in str(results[1].errors[-1]))
+
+    assert('no such action' in str(results[2].errors[0]))
+    assert(sorted(str(each) for each in results[3].errors) == [
+        'missing argument `target`', 'missing option `--mode`'])
+
+    # made once per action and reused for later records
+    required = copy._required
+    assert(required == {'source', 'target', 'mode'})
+    list(ctx.validate(['copy a', 'copy b']))
+    assert(copy._required is required)
+
+
+def test_validation_of_chains(ctx):
+    """ Chained invocations and diagnostic options
+        should be validated the way they are executed
+    """
+    def fetch(name):
+        pytest.fail(test_validation_of_chains.__doc__)
+    fetch = ctx.__call__(fetch)
+
+    ctx.delimiter = '+'
+    ctx.diagnostics = True
+    first, chained, second, third = ctx.validate([
+        'fetch a + fetch b', 'fetch a --measure', 'fetch a + fetch'])
+    assert(type(first) is type(chained) is ctx.Invocation)
+    assert(first.args == {'name': 'a'} and chained.args == {'name': 'b'})
+    assert(first.number == chained.number == 1)
+    assert(type(second) is ctx.Invocation and second.number == 2)
+    assert(type(third) is ctx.Failure)
+    assert([str(each) for each in third.errors] == [
+        'missing argument `name`'])
+
+
+def test_validation_of_positionals_only(ctx):
+    """ Positionals of an action without keyword-only arguments
+        could be given as options, but should not be required as such
+    """
+    def copy(source, target):
+        pytest.fail(test_validation_of_positionals_only.__doc__)
+    copy = ctx.__call__(copy)
+
+    ok, by_options, short = ctx.validate([
+        'copy a b', 'copy --source=a --target=b', 'copy a'])
+    assert(type(ok) is ctx.Invocation)
+    assert(ok.args == {'source': 'a', 'target': 'b'})
+    assert(type(by_options) is ctx.Invocation)
+    assert(by_options.args == {'source': 'a', 'target': 'b'})
+    assert([str(each) for each in short.errors] == [
+        'missing argument `target`'])
+
+
+def test_lazy_conversion(ctx):
+    """ Lazy annotations should convert on first access only,
+        and factories should only run for missing arguments
+    """
+    conversions = []
+    invocations = []
+
+    def load(value):
+        conversions.append(value)
+        return value.upper()
+
+    def make_default():
+        conversions.append(None)
+        return 'default'
+
+    def act(
+        path: ctx.Lazy(load), unused: ctx.Lazy(load),
+        *,
+        config: ctx.Lazy(load) = None,
+        profile: str = ctx.Factory(make_default)
+    ):
+        invocations.append((
+            path(), path(), config and config(), profile))
+    act = ctx.__call__(act)
+
+    ctx.execute('act a b --config=c')
+    assert(conversions == [None, 'a', 'c'])
+
+    ctx.execute('act a b -p x')
+    assert(conversions == [None, 'a', 'c', 'a'])
+    assert(invocations == [
+        ('A', 'A', 'C', 'default'),
+        ('A', 'A', None, 'x'),
+    ])
+
+
+def test_concurrent_conversion(ctx):
+    """ Converters of a concurrent action should run simultaneously,
+        and their errors should come in the order of arguments
+    """
+    invocations = []
+
+    def slow(value):
+        time.sleep(0.2)
+        if value.startswith('!'):
+            raise ValueError(value)
+        return value.upper()
+
+    @ctx.concurrent
+    @ctx.__call__
+    def act(
+        a: slow, b: slow,
+        *, c: ('c', 'c', slow) = None, d: ctx.Count = 0
+    ):
+        invocations.append((a, b, c, d))
+
+    start = time.perf_counter()
+    ctx.execute('act x y -c z -dd')
+    assert(time.perf_counter() - start < 0.4)
+    assert(invocations == [('X', 'Y', 'Z', 2)])
+
+    with pytest.raises(ValueError) as error:
+        ctx.execute('act x !y -c !z')
+    assert(str(error.value) == '!y')
+
+    [failure] = ctx.validate(['act !x y -c !z'])
+    assert([str(each) for each in failure.errors] == ['!x', '!z'])
+
+
+def test_file_annotations(ctx, tmp_path):
+    """ Mapped files and input streams should be handed
+        to the action open and closed after it returns
+    """
+    first = tmp_path / 'first'
+    first.write_bytes(b'mapped contents')
+    second = tmp_path / 'second'
+    second.write_bytes(b'streamed contents')
+    invocations = []
+
+    def act(
+        data: ctx.MappedFile,
+        *,
+        stream: ctx.InputStream = None,
+        extra: ctx.Append('x', 'extra', type=ctx.MappedFile) = ()
+    ):
+        view = memoryview(data)
+        invocations.append((
+            bytes(view[:6]), stream.read(), [bytes(each) for each in extra]))
+        view.release()
+        return data, stream, extra
+    act = ctx.__call__(act)
+
+    data, stream, [extra] = ctx.execute([
+        'act', str(first), '-s', str(second), '-x', str(first)])
+    assert(invocations == [
+        (b'mapped', b'streamed contents', [b'mapped contents'])])
+    assert(data.closed and stream.closed and extra.closed)
+
+    empty = tmp_path / 'empty'
+    empty.touch()
+    with pytest.raises(ValueError):
+        ctx.execute(['act', str(empty)])
+
+
+def test_streaming_output(ctx, capsys, monkeypatch):
+    """ Items of a returned iterable should be written out
+        in batches, and a broken pipe should stop the iteration
+    """
+    produced = []
+
+    @ctx.streaming(terminator='\0', batch=8)
+    @ctx.__call__
+    def numbers(count: int):
+        try:
+            for i in range(count):
+                produced.append(i)
+                yield i
+        finally:
+            produced.append('closed')
+
+    assert(ctx.execute('numbers 5') is None)
+    out, _ = capsys.readouterr()
+    assert(out == '0\x001\x002\x003\x004\x00')
+
+    @ctx.streaming
+    @ctx.__call__
+    def mixed(status: int):
+        if status:
+            return status
+        return iter(['text', b'bytes', b'more', 1])
+
+    assert(ctx.execute('mixed 3') == 3)
+    assert(ctx.execute('mixed 0') is None)
+    out, _ = capsys.readouterr()
+    assert(out == 'text\nbytes\nmore\n1\n')
+
+    @ctx.streaming
+    @ctx.__call__
+    def nothing():
+        pass
+
+    assert(ctx.execute('nothing') is None)
+
+    class Pipe(object):
+        def __init__(self):
+            self.writes = []
+
+        def write(self, text):
+            if self.writes:
+                raise BrokenPipeError()
+            self.writes.append(text)
+
+        def flush(self):
+            pass
+
+    pipe = Pipe()
+    monkeypatch.setattr(sys, 'stdout', pipe)
+    produced.clear()
+    ctx.execute('numbers 1000000')
+    assert(pipe.writes == ['0\x001\x002\x003\x00'])
+    assert(len(produced) == 9 and produced[-1] == 'closed')
+
+
+def test_result_cache(ctx, tmp_path):
+    """ Results should be reused for equal arguments and inputs
+        until the inputs change or the cache is bypassed
+    """
+    source = tmp_path / 'source'
+    source.write_text('x')
+    invocations = []
+
+    @ctx.cached(inputs=['path'], directory=str(tmp_path / 'cache'))
+    @ctx.__call__
+    def measure(path, *, scale: int = 1):
+        invocations.append((path, scale))
+        return len(open(path).read()) * scale
+
+    argv = 'measure {} --scale=2'.format(source)
+    assert(ctx.execute(argv) == 2)
+    assert(ctx.execute(argv) == 2)
+    assert(ctx.execute(argv + ' --no-cache') == 2)
+    assert(ctx.execute('measure {}'.format(source)) == 1)
+    assert(len(invocations) == 3)
+
+    source.write_text('xyz')
+    assert(ctx.execute(argv) == 6)
+    assert(len(invocations) == 4)
+
+    @ctx.cached(inputs=['path'], directory=str(tmp_path / 'cache'))
+    @ctx.__call__
+    def measure(path, *, scale: int = 1):
+        invocations.append((path, scale))
+        return len(open(path).read()) * scale * 10
+
+    assert(ctx.execute(argv) == 60)
+    assert(len(invocations) == 5)
+
+
+def test_result_cache_failures(ctx, tmp_path):
+    """ A cache which could not be written to
+        should not fail the action
+    """
+    blocker = tmp_path / 'file'
+    blocker.write_text('not a directory')
+    invocations = []
+
+    @ctx.cached(directory=str(blocker / 'cache'))
+    @ctx.__call__
+    def double(count: int):
+        invocations.append(count)
+        return count * 2
+
+    assert(ctx.execute('double 2') == 4)
+    assert(ctx.execute('double 2') == 4)
+    assert(invocations == [2, 2])
+
+
+def test_result_cache_eviction(ctx, tmp_path):
+    """ Least recently used results should go first
+        once the cache grows over its size
+    """
+    invocations = []
+    cache = tmp_path / 'cache'
+
+    @ctx.cached(directory=str(cache), size=1500)
+    @ctx.__call__
+    def pad(count: int):
+        invocations.append(count)
+        return 'x' * 600
+
+    ctx.execute('pad 1')
+    ctx.execute('pad 2')
+    ctx.execute('pad 1')
+    ctx.execute('pad 3')
+    assert(len(list(cache.iterdir())) == 2)
+
+    ctx.execute('pad 1')
+    ctx.execute('pad 2')
+    assert(invocations == [1, 2, 3, 2])
+
+
+def test_watch(ctx, tmp_path, capsys):
+    """ An action should run once at first
+        and once again for each change of watched files
+    """
+    import threading
+
+    source = tmp_path / 'source'
+    source.write_text('first')
+    invocations = []
+    ran = threading.Event()
+
+    def show(path, *, upper: bool = False):
+        text = open(path).read()
+        invocations.append(text.upper() if upper else text)
+        ran.set()
+    show = ctx.__call__(show)
+
+    watching = threading.Thread(target=ctx.watch, args=(
+        'show {} --upper'.format(source), [str(source)]),
+        kwargs={'debounce': 0.05, 'interval': 0.05, 'runs': 2})
+    watching.start()
+
+    assert(ran.wait(5))
+    ran.clear()
+    source.write_text('second')
+    assert(ran.wait(5))
+    watching.join(5)
+
+    assert(not watching.is_alive())
+    assert(invocations == ['FIRST', 'SECOND'])
+
+
+def test_diagnostics(ctx, tmp_path, capsys):
+    """ Diagnostic options should be handled by the context
+        and never reach the action
+    """
+    invocations = []
+
+    def act(*args, verbose: ctx.Count = 0):
+        invocations.append((args, verbose))
+        return [0] * 1000
+    act = ctx.__call__(act)
+
+    ctx.execute('act --measure')
+    assert(invocations == [(('--measure',), 0)])
+    invocations.clear()
+
+    ctx.diagnostics = True
+    profile = tmp_path / 'profile'
+    ctx.execute(
+        'act -v --measure --trace-malloc --profile={} -- --measure'.format(
+            profile))
+    assert(invocations == [(('--measure',), 1)])
+
+    import pstats
+    assert(pstats.Stats(str(profile)).total_calls > 0)
+    _, err = capsys.readouterr()
+    assert('wall ' in err and 'cpu ' in err and 'peak ' in err)
+    assert('pytka.py' in err)
+
+
+def test_chained_invocations(ctx):
+    """ Invocations separated by the delimiter
+        should all be parsed before any of them runs,
+        with adjacent independent ones running concurrently
+    """
+    import threading
+
+    events = []
+    both_fetching = threading.Barrier(2, timeout=5)
+
+    @ctx.independent
+    @ctx.__call__
+    def fetch(name):
+        events.append(('fetch', name))
+        both_fetching.wait()
+
+    def index(*, fail: bool = False):
+        events.append(('index',))
+        return 3 if fail else None
+    index = ctx.__call__(index)
+
+    ctx.delimiter = '+'
+    assert(ctx.execute('fetch a + fetch b + index + index') is None)
+    assert(sorted(events[:2]) == [('fetch', 'a'), ('fetch', 'b')])
+    assert(events[2:] == [('index',), ('index',)])
+
+    events.clear()
+    assert(ctx.execute('index + index --fail + index') == 3)
+    assert(len(events) == 3)
+
+    events.clear()
+    with pytest.raises(TypeError):
+        ctx.execute('index + index --no-such-option')
+    assert(events == [])
+
+    def echo(*words):
+        return words
+    echo = ctx.__call__(echo)
+
+    assert(ctx.execute('echo -- a + b') == ('a', '+', 'b'))
+
+    with pytest.raises(RuntimeError, match='no action specified'):
+        ctx.execute('+ +')
+    ctx.default(echo)
+    assert(ctx.execute('+') == ())
+    assert(ctx.execute('index + echo -- a + b') == ('a', '+', 'b'))
+
+
+def test_chain_release_on_failure(ctx, tmp_path):
+    """ Arguments bound for earlier invocations of a chain
+        should be released when a later one fails to bind
+    """
+    path = tmp_path / 'data'
+    path.write_bytes(b'contents')
+    mapped = []
+
+    def read(data: ctx.MappedFile):
+        pytest.fail(test_chain_release_on_failure.__doc__)
+    read = ctx.__call__(read)
+
+    def count(*, n: int):
+        pytest.fail(test_chain_release_on_failure.__doc__)
+    count = ctx.__call__(count)
+
+    class Recording(ctx.MappedFile):
+        def __new__(cls, path):
+            mapping = super().__new__(cls, path)
+            mapped.append(mapping)
+            return mapping
+    read.arguments['data'] = Recording
+
+    ctx.delimiter = '+'
+    with pytest.raises(ValueError):
+        ctx.execute(['read', str(path), '+', 'count', '--n=x'])
+    assert(len(mapped) == 1 and mapped[0].closed)
+
+
+def test_release_on_failure(ctx, tmp_path):
+    """ Files opened for arguments converted so far
+        should be closed when a later argument fails to convert
+    """
+    path = tmp_path / 'data'
+    path.write_bytes(b'contents')
+    mapped = []
+
+    class Recording(ctx.MappedFile):
+        def __new__(cls, path):
+            mapping = super().__new__(cls, path)
+            mapped.append(mapping)
+            return mapping
+
+    def failing(value):
+        time.sleep(0.05)
+        raise ValueError(value)
+
+    def read(data: Recording, n: int):
+        pytest.fail(test_release_on_failure.__doc__)
+    read = ctx.__call__(read)
+
+    def tail(*, data: ('d', 'data', Recording), n: int):
+        pytest.fail(test_release_on_failure.__doc__)
+    tail = ctx.__call__(tail)
+
+    @ctx.concurrent
+    @ctx.__call__
+    def both(data: Recording, other: failing, *, quiet: bool = False):
+        pytest.fail(test_release_on_failure.__doc__)
+
+    for attempt in (
+        lambda: ctx.execute(['read', str(path), 'x']),
+        lambda: ctx.execute(['read', str(path), '1', 'extra']),
+        lambda: ctx.execute(['tail', '-d', str(path), '-n', 'x']),
+        lambda: ctx.execute(['both', str(path), 'x']),
+        lambda: ctx.invoke('read', str(path), 'x'),
+        lambda: ctx.invoke('tail', data=str(path), n='x'),
+    ):
+        mapped.clear()
+        with pytest.raises((ValueError, TypeError)):
+            attempt()
+        assert(len(mapped) == 1 and mapped[0].closed)
+
+
+def test_fork(ctx):
+    """ A forked context should see actions of its parent,
+        while its own additions and overrides stay its own
+    """
+    invocations = []
+
+    def install(package):
+        invocations.append(('parent install', package))
+    install = ctx.__call__(install)
+
+    def fallback(package):
+        invocations.append(('parent fallback', package))
+    fallback = ctx.default(fallback)
+
+    child = ctx.fork()
+
+    def remove(package):
+        invocations.append(('child remove', package))
+    remove = child.__call__(remove)
+
+    def install(package):
+        invocations.append(('child install', package))
+    install = child.__call__(install)
+
+    child.execute('remove a')
+    child.execute('install b')
+    child.execute('c')
+    ctx.execute('install d')
+    ctx.execute('remove')
+    assert(invocations == [
+        ('child remove', 'a'),
+        ('child install', 'b'),
+        ('parent fallback', 'c'),
+        ('parent install', 'd'),
+        ('parent fallback', 'remove'),
+    ])
+    assert(set(ctx.actions) == {'install'})
+    assert(child.actions.maps[1] is ctx.actions)
+
+    def fallback(package):
+        pass
+    child.default(fallback)
+    with pytest.raises(TypeError):
+        child.default(fallback)
+
+
+def test_choice(ctx):
+    """ Choices should accept listed names, unique prefixes
+        and enum members, and report anything else helpfully
+    """
+    import enum
+
+    class Size(enum.Enum):
+        small = 1
+        large = 2
+
+    regions = ['eu-north-1', 'eu-west-1', 'us-east-1', 'us-east-2']
+    invocations = []
+
+    def launch(
+        region: ctx.Choice(regions, prefix=True),
+        *, size: ctx.Choice(Size) = Size.small
+    ):
+        invocations.append((region, size))
+    launch = ctx.__call__(launch)
+
+    ctx.execute('launch eu-west-1')
+    ctx.execute('launch us-east-2 --size=large')
+    ctx.execute('launch eu-n -s small')
+    assert(invocations == [
+        ('eu-west-1', Size.small),
+        ('us-east-2', Size.large),
+        ('eu-north-1', Size.small),
+    ])
+
+    with pytest.raises(ValueError) as error:
+        ctx.execute('launch us-east')
+    assert('ambiguous' in str(error.value))
+    with pytest.raises(ValueError) as error:
+        ctx.execute('launch eu-west-1 --size=larg')
+    assert('did you mean `large`' in str(error.value))
+    with pytest.raises(ValueError) as error:
+        ctx.Choice(['only'], prefix=True)('')
+    assert('invalid choice' in str(error.value))
+
+    assert(ctx._complete('launch ', 'us') == ['us-east-1', 'us-east-2'])
+    assert(ctx._complete('launch --size=', 'l') == ['large'])
+    assert(ctx._complete('launch -s ', '') == ['large', 'small'])
+    assert(ctx._complete('launch eu-west-1 ', 's') == [])
+
+    # conversions postponed by `concurrent` should still be completed
+    launch = ctx.concurrent(launch)
+    assert(ctx._complete('launch ', 'u') == ['us-east-1', 'us-east-2'])
+    assert(ctx._complete('launch --size ', 'l') == ['large'])
+    ctx.execute('launch eu-w -s large')
+    assert(invocations[-1] == ('eu-west-1', Size.large))
+
+
+def test_executor(ctx):
+    """ An executor argument should get a pool of `--jobs` workers,
+        started on first use and shut down once the action returns
+    """
+    pools = []
+
+    def fan_out(*numbers: int, pool: ctx.Executor):
+        pools.append(pool)
+        return sum(pool.map(abs, map(int, numbers)))
+    fan_out = ctx.__call__(fan_out)
+
+    def idle(*, workers: ctx.Executor('w', 'workers')):
+        pools.append(workers)
+        return workers.jobs
+    idle = ctx.__call__(idle)
+
+    assert(ctx.execute(['fan_out', '-j', '2', '--', '1', '-2', '3']) == 6)
+    assert(pools[-1].jobs == 2)
+    assert(isinstance(pools[-1], concurrent.futures.Executor))
+    with pytest.raises(RuntimeError):
+        pools[-1].submit(abs, 1)
+
+    assert(ctx.execute(['fan_out', '4']) == 4)
+    assert(pools[-1].jobs == (os.cpu_count() or 1))
+
+    assert(ctx.execute(['idle', '--workers=3']) == 3)
+    assert(pools[-1]._executor is None)
+
+    with pytest.raises(ValueError):
+        ctx.execute(['idle', '-w', '0'])
+    with pytest.raises(RuntimeError, match='at most once'):
+        ctx.execute(['idle', '-w', '1', '-w', '2'])
+    assert(isinstance(idle.options['workers'], ctx.Key))
+    assert(idle.options['workers'].type is int)
+
+    def spawn(*, pool: ctx.Executor(pool=ProcessPoolExecutor)):
+        pools.append(pool)
+        return pool.jobs
+    spawn = ctx.concurrent(ctx.__call__(spawn))
+
+    assert(ctx.execute(['spawn', '-j', '2']) == 2)
+    assert(pools[-1].type is ProcessPoolExecutor)
+    with pytest.raises(ValueError):
+        ctx.execute(['spawn', '-j', '0'])
+
+
+def test_invoke(ctx):
+    """ Structured positionals and options should be converted
+        and folded the same way as parsed ones
+    """
+    def serve(
+        host, port: int,
+        *, verbose: ctx.Count = 0, quiet: bool = False,
+        tag: ctx.Append = (), depth: int = 1
+    ):
+        return (host, port, verbose, quiet, tag, depth)
+    serve = ctx.__call__(serve)
+
+    expected = ctx.execute([
+        'serve', 'h', '80', '-vvv', '-q', '-t', 'x', '-t', 'y', '-d', '2'])
+    assert(expected == ('h', 80, 3, True, ('x', 'y'), 2))
+    assert(ctx.invoke(
+        'serve', 'h', '80',
+        verbose=3, quiet=True, tag=['x', 'y'], depth='2') == expected)
+    assert(ctx.invoke('serve', 'h', 80, quiet=False, tag='x') == (
+        'h', 80, 0, False, ('x',), 1))
+
+    with pytest.raises(RuntimeError, match='did you mean `serve`'):
+        ctx.invoke('serv')
+    with pytest.raises(TypeError, match='did you mean `depth`'):
+        ctx.invoke('serve', 'h', '80', dept=2)
+    with pytest.raises(RuntimeError, match='at most once'):
+        ctx.invoke('serve', 'h', '80', depth=[1, 2])
+    with pytest.raises(ValueError):
+        ctx.invoke('serve', 'h', 'http')
+    with pytest.raises(TypeError, match='too many'):
+        ctx.invoke('serve', 'h', '80', 'extra')
+
+
+class Rejection(Exception):
+    """ An exception which pickles, but could not be unpickled
+    """
+    def __init__(self, code, reason):
+        super().__init__('{}: {}'.format(code, reason))
+
+
+def test_simulate(ctx, tmp_path):
+    """ A simulated command line should run in-process
+        with its output captured and global state restored,
+        leaving usage statistics and recordings alone
+    """
+    def greet(name, *, loud: bool = False):
+        os.environ['GREETED'] = name
+        print(name.upper() if loud else name)
+        print(os.environ.get('GREETING'), file=sys.stderr)
+        return len(sys.argv)
+    greet = ctx.__call__(greet)
+
+    argv = sys.argv
+    outcome = ctx.simulate('greet "big world" --loud', env={'GREETING': 'hi'})
+    assert(outcome == (4, None, 'BIG WORLD\n', 'hi\n'))
+    assert(sys.argv is argv)
+    assert('GREETED' not in os.environ and 'GREETING' not in os.environ)
+
+    ctx.statistics = str(tmp_path / 'usage')
+    ctx.recording = str(tmp_path / 'recording')
+    assert(ctx.simulate('greet quiet').stdout == 'quiet\n')
+    assert(not os.path.exists(ctx.statistics))
+    assert(not os.path.exists(ctx.recording))
+    ctx.statistics = ctx.recording = None
+
+    outcome = ctx.simulate(['greet'])
+    assert(isinstance(outcome.error, TypeError))
+    assert(outcome.value is None and outcome.stdout == '')
+
+    def reject():
+        raise Rejection(403, 'forbidden')
+    reject = ctx.__call__(reject)
+
+    cases = [['greet', str(n)] for n in range(20)] + [['nope'], ['reject']]
+    outcomes = ctx.simulate_many(cases, processes=3)
+    assert([each.stdout for each in outcomes[:-2]] == [
+        '{}\n'.format(n) for n in range(20)])
+    assert(isinstance(outcomes[-2].error, RuntimeError))
+    assert('403: forbidden' in str(outcomes[-1].error))
+
+
+def test_record_and_replay(ctx, tmp_path):
+    """ Recorded command lines should be read back as given
+        and replayed with or without running actions
+    """
+    ran = []
+
+    def add(a: int, b: int):
+        ran.append(a + b)
+        return a + b
+    add = ctx.__call__(add)
+
+    ctx.recording = str(tmp_path / 'missing' / 'recording')
+    assert(ctx.execute(['add', '0', '0']) == 0)
+
+    ctx.recording = str(tmp_path / 'recording')
+    ran.clear()
+    for n in range(5):
+        assert(ctx.execute(['add', str(n), '1']) == n + 1)
+    with pytest.raises(ValueError):
+        ctx.execute(['add', 'x', '\udcff'])
+    ctx.recording = None
+
+    recorded = list(ctx.recorded(str(tmp_path / 'recording')))
+    assert([argv for argv, _ in recorded] == [
+        ['add', str(n), '1'] for n in range(5)] + [['add', 'x', '\udcff']])
+    assert(all(elapsed > 0 for _, elapsed in recorded))
+
+    with open(str(tmp_path / 'recording'), 'ab') as file:
+        file.write(b'\xff\x00')
+    ran.clear()
+    replay = ctx.replay(str(tmp_path / 'recording'))
+    assert((replay.count, replay.failures) == (6, 1) and ran == [])
+    replay = ctx.replay(str(tmp_path / 'recording'), execute=True)
+    assert((replay.count, replay.failures) == (6, 1))
+    assert(ran == [1, 2, 3, 4, 5])
+
+    ctx.delimiter = '+'
+    ctx.diagnostics = True
+    ctx.recording = str(tmp_path / 'chains')
+    ctx.execute(['add', '1', '1', '+', 'add', '2', '2'])
+    ctx.execute(['add', '3', '3', '--measure=' + str(tmp_path / 'measure')])
+    ctx.recording = None
+    ran.clear()
+    replay = ctx.replay(str(tmp_path / 'chains'))
+    assert((replay.count, replay.failures) == (2, 0) and ran == [])
+    replay = ctx.replay(str(tmp_path / 'chains'), execute=True)
+    assert((replay.count, replay.failures) == (2, 0))
+    assert(ran == [2, 4, 6])
+
+
+def test_usage_statistics(ctx, tmp_path):
+    """ Every invocation should be recorded with its timing,
+        and a summary should be made out of the records
+    """
+    ctx.statistics = str(tmp_path / 'usage')
+
+    def ok(n: int):
+        return 0
+    ok = ctx.__call__(ok)
+
+    def bad():
+        raise ValueError
+    bad = ctx.__call__(bad)
+
+    def describe_instance_attribute_modifications_fast():
+        return 0
+    describe_instance_attribute_modifications_fast = ctx.__call__(
+        describe_instance_attribute_modifications_fast)
+
+    def describe_instance_attribute_modifications_slow():
+        return 0
+    describe_instance_attribute_modifications_slow = ctx.__call__(
+        describe_instance_attribute_modifications_slow)
+
+    for n in range(10):
+        assert(ctx.execute(['ok', str(n)]) == 0)
+    with pytest.raises(ValueError):
+        ctx.execute(['bad'])
+    with pytest.raises(ValueError):
+        ctx.execute(['ok', 'x'])
+
+    recorded = ctx.statistics
+    ctx.statistics = str(tmp_path / 'missing' / 'usage')
+    assert(ctx.execute(['ok', '1']) == 0)
+    with pytest.raises(ValueError):
+        ctx.execute(['bad'])
+    ctx.statistics = recorded
+
+    ctx.execute(['describe_instance_attribute_modifications_fast'])
+    ctx.execute(['describe_instance_attribute_modifications_slow'])
+    ctx.execute(['describe_instance_attribute_modifications_slow'])
+
+    usage = ctx.usage(ctx.statistics)
+    assert(sorted(usage) == [
+        'bad',
+        'describe_instance_attribute_modifications_fast',
+        'describe_instance_attribute_modifications_slow',
+        'ok'])
+    assert(usage['describe_instance_attribute_modifications_slow'].count == 2)
+    assert(usage['ok'].count == 10 and usage['ok'].failures == 0)
+    assert(usage['bad'].count == 1 and usage['bad'].failures == 1)
+    assert(sum(usage['ok'].histogram.values()) == 10)
+    assert(usage['ok'].run[0] <= usage['ok'].run[1] <= usage['ok'].run[2])
+
+
 def test_default_action(ctx):
     """ Default action should be invoked on unknown word occurrence
     """
@@ -520,6 +1452,54 @@ def test_unknown_action(ctx):
         pytest.fail(test_unknown_action.__doc__)
 
 
+def test_unknown_action_suggestions(ctx):
+    """ An unknown action should be reported
+        along with the closest registered names
+    """
+    def install(arg):
+        pytest.fail(test_unknown_action_suggestions.__doc__)
+    install = ctx.__call__(install)
+
+    def uninstall(arg):
+        pytest.fail(test_unknown_action_suggestions.__doc__)
+    uninstall = ctx.__call__(uninstall)
+
+    def list():
+        pytest.fail(test_unknown_action_suggestions.__doc__)
+    list = ctx.__call__(list)
+
+    with pytest.raises(RuntimeError) as error:
+        ctx.execute('instal ffmpeg')
+    assert('did you mean `install`' in str(error.value))
+    assert('list' not in str(error.value))
+
+    with pytest.raises(RuntimeError) as error:
+        ctx.execute('frobnicate ffmpeg')
+    assert('did you mean' not in str(error.value))
+
+
+def test_unknown_option_suggestions(ctx):
+    """ An unknown option should be reported by name
+        along with the closest known spellings
+    """
+    def act(*, verbose: ctx.Count = 0, depth: int = 0):
+        pytest.fail(test_unknown_option_suggestions.__doc__)
+    act = ctx.__call__(act)
+
+    with pytest.raises(TypeError) as error:
+        ctx.execute('act --verbsoe')
+    assert('`--verbsoe`' in str(error.value))
+    assert('did you mean `--verbose`' in str(error.value))
+
+    with pytest.raises(TypeError) as error:
+        ctx.execute('act --deph=3')
+    assert('did you mean `--depth`' in str(error.value))
+
+    with pytest.raises(TypeError) as error:
+        ctx.execute('act -- --verbsoe')
+    assert(str(error.value) == 'too many arguments')
+
+
 def test_no_action(ctx):
     """ With no default and no action specified,
         an error should be risen
@@ -697,5 +1677,93 @@ def test_variadic(ctx):
     assert(invocations == [('arg0', 'arg1', 'arg2')])
 
 
+def assert_linear(run, make_argv, size=1000, factor=8, repeat=5):
+    """ Parsing an input `factor` times larger
+        should take at most proportionally more time and memory,
+        up to a margin leaving quadratic growth way behind
+    """
+    run(make_argv(size))  # let lazily built indices settle
+
+    costs = []
+    for each_size in (size, size * factor):
+        best = float('inf')
+        for argv in [make_argv(each_size) for _ in range(repeat)]:
+            start = time.perf_counter()
+            run(argv)
+            best = min(best, time.perf_counter() - start)
+
+        argv = make_argv(each_size)
+        tracemalloc.start()
+        run(argv)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        costs.append((best, peak))
+
+    (small_time, small_peak), (large_time, large_peak) = costs
+    assert(large_time / small_time < factor * 3)
+    assert(large_peak / small_peak < factor * 2)
+
+
+def test_scaling_with_argv_length(ctx):
+    """ Long command lines should parse in linear time
+    """
+    def act(*args, verbose: ctx.Count = 0, name: ctx.Append = ()):
+        pass
+    act = ctx.__call__(act)
+
+    assert_linear(
+        ctx.execute,
+        lambda size: ['act'] + ['-v', 'x', '--name=y', '-n', 'z'] * size)
+
+
+def test_scaling_with_option_count(ctx):
+    """ Actions with many options should parse in linear time
+    """
+    def make_action(count):
+        namespace = {}
+        exec(
+            'def act(*, {}):\n    pass\n'.format(', '.join(
+                'o{0}: ("", "o{0}", int) = 0'.format(i)
+                for i in range(count))),
+            namespace)
+        return ctx.__call__(namespace['act'])
+
+    actions = {}
+
+    def make_argv(size):
+        if size not in actions:
+            actions[size] = make_action(size)
+        return ['--o{}=1'.format(i) for i in range(size)]
+
+    assert_linear(
+        lambda argv: ctx._parse_options(actions[len(argv)], argv),
+        make_argv)
+
+
+def test_scaling_with_cluster_length(ctx):
+    """ Clusters of short options should parse in linear time
+    """
+    def act(*, verbose: ctx.Count = 0):
+        pass
+    act = ctx.__call__(act)
+
+    assert_linear(
+        ctx.execute,
+        lambda size: ['act', '-' + 'v' * size])
+
+
+def test_scaling_with_positionals_after_dash_dash(ctx):
+    """ Positionals after `--` should parse in linear time
+    """
+    def act(*rest, verbose: ctx.Count = 0):
+        pass
+    act = ctx.__call__(act)
+
+    assert_linear(
+        ctx.execute,
+        lambda size: ['act', '-v', '--'] + ['-x', 'y'] * size)
+
+
 if __name__ == '__main__':
     pytest.main(sys.argv)